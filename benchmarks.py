@@ -0,0 +1,536 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import multiprocessing
+import time
+
+import numpy as np
+
+from geometry import (intersection_points, orientations,
+                      polygon_difference, polygon_union, ring_crossings,
+                      segments_intersect_batch)
+from engine import (Line, MapEngine, Point, order_points, save_lands_to_file,
+                    sort_points)
+from generate import random_clicks, run_clicks
+from mapfile import FORMATS, open_map, save_map
+from ownership import LandIndex
+from matplotlib.figure import Figure
+from profiling import PROFILER
+from reading import (Land as FileLand, Point as FilePoint, display_lands,
+                     load_lands_from_file)
+from sampling import DISTRIBUTIONS, generate_area_coords
+from tiling import generate_tiled
+
+
+def random_points(n, seed=0, size=1000):
+    rng = np.random.RandomState(seed)
+    return [
+        Point(int(x), int(y), "black")
+        for x, y in rng.randint(0, size, size=(n, 2))
+    ]
+
+
+def count_crossings(points):
+    lines = [
+        Line(points[i], points[(i + 1) % len(points)])
+        for i in range(len(points))
+    ]
+    crossings = 0
+    for i in range(len(lines)):
+        for j in range(i + 1, len(lines)):
+            if lines[i].intersects(lines[j]):
+                crossings += 1
+    return crossings
+
+
+def _timed_ordering(function_name, n, seed, results):
+    function = {"sort_points": sort_points, "order_points": order_points}[
+        function_name]
+    points = random_points(n, seed)
+    start = time.perf_counter()
+    try:
+        ordered = function(points)
+    except Exception as error:
+        results.put((None, type(error).__name__))
+        return
+    results.put((time.perf_counter() - start, count_crossings(ordered)))
+
+
+def run_with_timeout(function_name, n, seed, timeout):
+    """sort_points can loop forever, so every measurement runs in its own process."""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_timed_ordering,
+                                      args=(function_name, n, seed, results))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return None
+    return results.get()
+
+
+def bench_ordering(sizes, repeats, timeout):
+    print(f"{'n':>6} {'function':>13} {'seconds':>10} {'crossings':>10}")
+    for n in sizes:
+        for function_name in ("sort_points", "order_points"):
+            for seed in range(repeats):
+                result = run_with_timeout(function_name, n, seed, timeout)
+                if result is None:
+                    print(f"{n:>6} {function_name:>13} {'timeout':>10} {'-':>10}")
+                else:
+                    seconds, crossings = result
+                    if seconds is None:
+                        print(f"{n:>6} {function_name:>13} {'error':>10} "
+                              f"{crossings:>10}")
+                    else:
+                        print(f"{n:>6} {function_name:>13} {seconds:>10.4f} "
+                              f"{crossings:>10}")
+
+
+def python_orientation(p, q, r):
+    val = (q[1] - p[1]) * (r[0] - q[0]) - (q[0] - p[0]) * (r[1] - q[1])
+    if val == 0:
+        return 0
+    return 1 if val > 0 else -1
+
+
+def python_intersects(p1, p2, q1, q2):
+    """The per-object Line.intersects algorithm, on tuples."""
+    def on_segment(p, q, r):
+        return (min(p[0], r[0]) <= q[0] <= max(p[0], r[0])
+                and min(p[1], r[1]) <= q[1] <= max(p[1], r[1]))
+
+    if p1 == q1 or p1 == q2 or p2 == q1 or p2 == q2:
+        return False
+    o1 = python_orientation(p1, p2, q1)
+    o2 = python_orientation(p1, p2, q2)
+    o3 = python_orientation(q1, q2, p1)
+    o4 = python_orientation(q1, q2, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and on_segment(p1, q1, p2))
+            or (o2 == 0 and on_segment(p1, q2, p2))
+            or (o3 == 0 and on_segment(q1, p1, q2))
+            or (o4 == 0 and on_segment(q1, p2, q2)))
+
+
+def python_intersection_point(p1, p2, q1, q2):
+    a1 = p2[1] - p1[1]
+    b1 = p1[0] - p2[0]
+    c1 = a1 * p1[0] + b1 * p1[1]
+    a2 = q2[1] - q1[1]
+    b2 = q1[0] - q2[0]
+    c2 = a2 * q1[0] + b2 * q1[1]
+    det = a1 * b2 - a2 * b1
+    if det == 0:
+        return None
+    return ((b2 * c1 - b1 * c2) / det, (a1 * c2 - a2 * c1) / det)
+
+
+def bench_kernels(sizes):
+    print(f"{'segments':>9} {'kernel':>19} {'python s':>10} {'numpy s':>10} "
+          f"{'speedup':>8}")
+    for n in sizes:
+        rng = np.random.RandomState(n)
+        p1, p2, q1, q2 = rng.randint(0, 1000, size=(4, n, 2)).astype(float)
+        rows = [tuple(map(tuple, row)) for row in zip(p1, p2, q1, q2)]
+
+        kernels = [
+            ("orientation",
+             lambda: [python_orientation(*row[:3]) for row in rows],
+             lambda: orientations(p1, p2, q1)),
+            ("intersects",
+             lambda: [python_intersects(*row) for row in rows],
+             lambda: segments_intersect_batch(p1, p2, q1, q2)),
+            ("intersection_point",
+             lambda: [python_intersection_point(*row) for row in rows],
+             lambda: intersection_points(p1, p2, q1, q2)),
+        ]
+        for name, python_kernel, numpy_kernel in kernels:
+            start = time.perf_counter()
+            expected = python_kernel()
+            python_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            result = numpy_kernel()
+            numpy_seconds = time.perf_counter() - start
+            if name == "intersection_point":
+                expected = np.array([(np.nan, np.nan) if point is None else point
+                                     for point in expected])
+                assert np.allclose(expected, result, equal_nan=True)
+            else:
+                assert np.array_equal(np.array(expected), result)
+            print(f"{n:>9} {name:>19} {python_seconds:>10.4f} "
+                  f"{numpy_seconds:>10.4f} "
+                  f"{python_seconds / numpy_seconds:>7.1f}x")
+
+
+def bench_boolean(sizes, repeats):
+    print(f"{'vertices':>9} {'operation':>11} {'seconds':>10} {'rings':>6} "
+          f"{'crossings':>10}")
+    for n in sizes:
+        # Two overlapping wobbly circles, so the outlines cross a few times
+        # like neighbouring lands do
+        rng = np.random.RandomState(n)
+        angles = np.sort(rng.random_sample((2, n)) * 2 * np.pi, axis=1)
+        radii = 400 + 20 * np.sin(7 * angles + rng.random_sample((2, 1)) * 7)
+        a = np.column_stack([np.cos(angles[0]), np.sin(angles[0])]) * radii[0, :, None]
+        b = np.column_stack([np.cos(angles[1]), np.sin(angles[1])]) * radii[1, :, None] + 300
+        for name, operation in (("union", polygon_union),
+                                ("difference", polygon_difference)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                rings = operation(a, b)
+            seconds = (time.perf_counter() - start) / repeats
+            crossings = sum(len(ring_crossings(ring)) for ring in rings)
+            print(f"{n:>9} {name:>11} {seconds:>10.4f} {len(rings):>6} "
+                  f"{crossings:>10}")
+
+
+def python_area_points(num_points, i, j, size):
+    """Per-point randint loop that MapArea.generate_points used to run."""
+    return [(np.random.randint(i * size, (i + 1) * size),
+             np.random.randint(j * size, (j + 1) * size))
+            for _ in range(num_points)]
+
+
+def bench_points(sizes, cells=1000):
+    cell_keys = [(i, j) for i in range(-16, 16) for j in range(-16, 16)][:cells]
+    print(f"{len(cell_keys)} cells of size 100")
+    print(f"{'per cell':>9} {'distribution':>13} {'seconds':>10} "
+          f"{'points/s':>12}")
+    for n in sizes:
+        start = time.perf_counter()
+        for i, j in cell_keys:
+            python_area_points(n, i, j, 100)
+        seconds = time.perf_counter() - start
+        print(f"{n:>9} {'python loop':>13} {seconds:>10.4f} "
+              f"{n * len(cell_keys) / seconds:>12.0f}")
+        for distribution in sorted(DISTRIBUTIONS):
+            start = time.perf_counter()
+            for i, j in cell_keys:
+                generate_area_coords(0, i, j, n, 100, distribution)
+            seconds = time.perf_counter() - start
+            print(f"{n:>9} {distribution:>13} {seconds:>10.4f} "
+                  f"{n * len(cell_keys) / seconds:>12.0f}")
+
+
+def bench_mapfile(sizes, land_size=100):
+    print(f"{'vertices':>9} {'format':>7} {'save s':>8} {'load s':>8} "
+          f"{'MB':>7}")
+    colors = ["red", "blue", "green", "yellow"]
+    for n in sizes:
+        rng = np.random.RandomState(n)
+        coords = rng.random_sample((n, 2)) * 1000
+        rings = [(coords[start:start + land_size],
+                  colors[start // land_size % len(colors)])
+                 for start in range(0, n, land_size)]
+        with tempfile.TemporaryDirectory() as directory:
+            for format in FORMATS:
+                filename = os.path.join(directory, "map." + format)
+                start = time.perf_counter()
+                save_map(rings, filename, format)
+                save_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                loaded = sum(len(ring) for ring, _ in open_map(filename))
+                load_seconds = time.perf_counter() - start
+                assert loaded == n
+                print(f"{n:>9} {format:>7} {save_seconds:>8.3f} "
+                      f"{load_seconds:>8.3f} "
+                      f"{os.path.getsize(filename) / 2**20:>7.1f}")
+
+
+def python_display_lands(lands, output):
+    """The original reading.display_lands: one plot call per edge and vertex."""
+    fig = Figure(figsize=(10, 10))
+    ax = fig.add_subplot()
+    ax.set_xlim(0, 1000)
+    ax.set_ylim(0, 1000)
+    for land in lands:
+        for line in land.lines:
+            ax.plot([line.p1.x, line.p2.x], [line.p1.y, line.p2.y],
+                    color=line.color)
+        for point in land.points:
+            ax.plot(point.x, point.y, 'o', color=point.color)
+    ax.set_title('Mapa z wczytanymi landami')
+    ax.set_aspect('equal')
+    fig.savefig(output)
+
+
+def bench_display(sizes, land_size=20, timeout=30.0):
+    colors = ["red", "blue", "green", "yellow"]
+    print(f"{'lands':>7} {'renderer':>18} {'seconds':>10}")
+    for n in sizes:
+        rng = np.random.RandomState(n)
+        lands = []
+        for k in range(n):
+            center = rng.random_sample(2) * 1000
+            coords = center + rng.random_sample((land_size, 2)) * 30
+            color = colors[k % len(colors)]
+            lands.append(FileLand([FilePoint(x, y, color)
+                                   for x, y in coords.tolist()], color))
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "map.png")
+            renderers = [
+                ("per-edge plot", lambda: python_display_lands(lands, output)),
+                ("batched", lambda: display_lands(lands, output=output)),
+                ("batched, no points",
+                 lambda: display_lands(lands, False, output)),
+            ]
+            for name, render in renderers:
+                # The per-edge version takes about 1.4 ms per vertex, so it
+                # is skipped when it would run longer than timeout
+                if name == "per-edge plot" and n * land_size > timeout * 700:
+                    print(f"{n:>7} {name:>18} {'skipped':>10}")
+                    continue
+                start = time.perf_counter()
+                render()
+                print(f"{n:>7} {name:>18} "
+                      f"{time.perf_counter() - start:>10.3f}")
+
+
+def bench_ownership(sizes, clicks, world_size):
+    trace = list(random_clicks(clicks, 0, world_size,
+                               ["red", "blue", "green", "yellow"]))
+    engine = generate_tiled(trace, 0, workers=1)
+    rings = [(land.coords, land.color) for land in engine.lands]
+    start = time.perf_counter()
+    index = LandIndex.from_rings(rings)
+    print(f"{len(rings)} lands indexed in "
+          f"{time.perf_counter() - start:.4f} s")
+    print(f"{'points':>9} {'query':>8} {'seconds':>10} {'points/s':>12} "
+          f"{'owned':>7}")
+    for n in sizes:
+        rng = np.random.RandomState(n)
+        points = rng.random_sample((n, 2)) * world_size
+        start = time.perf_counter()
+        owners = index.lands_at(points)
+        seconds = time.perf_counter() - start
+        owned = sum(owner is not None for owner in owners)
+        print(f"{n:>9} {'batch':>8} {seconds:>10.4f} {n / seconds:>12.0f} "
+              f"{owned:>7}")
+        single = points[:min(n, 10000)]
+        start = time.perf_counter()
+        for x, y in single.tolist():
+            index.land_at(x, y)
+        seconds = time.perf_counter() - start
+        print(f"{len(single):>9} {'single':>8} {seconds:>10.4f} "
+              f"{len(single) / seconds:>12.0f}")
+
+
+def bench_tiles(clicks, world_size, worker_counts, tile_cells):
+    trace = list(random_clicks(clicks, 0, world_size,
+                               ["red", "blue", "green", "yellow"]))
+    print(f"{clicks} clicks on a {world_size:g} world, "
+          f"{multiprocessing.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>10} {'lands':>7} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        engine = generate_tiled(trace, 0, tile_cells, workers)
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print(f"{workers:>8} {seconds:>10.3f} {len(engine.lands):>7} "
+              f"{baseline / seconds:>7.2f}x")
+
+
+# Stages of the click pipeline reported by the suite, see profiling.py
+SUITE_STAGES = ["jarvis_marszuje", "convex_hull", "grow_land", "mini_grow",
+                "radius_scan", "generate_points", "history"]
+
+
+def suite_workloads(sizes):
+    """
+    Seeded click traces: for every size a dense world (about 10 clicks per
+    MapArea cell) and a sparse one (about 1), each with one and four colors.
+    """
+    for n in sizes:
+        for density, clicks_per_cell in (("dense", 10), ("sparse", 1)):
+            world_size = 100 * math.sqrt(n / clicks_per_cell)
+            for colors in (["red"], ["red", "blue", "green", "yellow"]):
+                name = f"{n}-{density}-{len(colors)}color"
+                yield name, list(random_clicks(n, n, world_size, colors, 0.1))
+
+
+def measure_workload(clicks, directory):
+    """Seconds spent on each part of generating and using one map."""
+    results = {}
+    engine = MapEngine(seed=0)
+    PROFILER.reset()
+    PROFILER.enable()
+    start = time.perf_counter()
+    run_clicks(engine, clicks)
+    results["clicks"] = time.perf_counter() - start
+    PROFILER.disable()
+    stages = PROFILER.summary()["stages"]
+    for stage in SUITE_STAGES:
+        results[stage] = stages.get(stage, {}).get("total_s", 0.0)
+
+    undone = 0
+    start = time.perf_counter()
+    while undone < 100 and engine.undo() is not None:
+        undone += 1
+    for _ in range(undone):
+        engine.redo()
+    results["undo_redo_100"] = time.perf_counter() - start
+
+    for extension in ("txt", "pmap"):
+        filename = os.path.join(directory, "map." + extension)
+        start = time.perf_counter()
+        save_lands_to_file(engine.lands, filename)
+        results[f"save_{extension}"] = time.perf_counter() - start
+        start = time.perf_counter()
+        load_lands_from_file(filename)
+        results[f"load_{extension}"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    display_lands(open_map(filename), output=os.path.join(directory, "map.png"),
+                  limits=None)
+    results["render"] = time.perf_counter() - start
+    results["lands"] = len(engine.lands)
+    return results
+
+
+def measure_kernels(timeout):
+    results = {}
+    points = random_points(10000, 0)
+    lines = [Line(points[i], points[i + 1]) for i in range(0, len(points), 2)]
+    start = time.perf_counter()
+    for i in range(len(lines) - 1):
+        lines[i].intersects(lines[i + 1])
+    results["Line.intersects_5000"] = time.perf_counter() - start
+    # sort_points is left to the ordering benchmark: it loops forever on
+    # most inputs, so here it would only ever record the timeout
+    result = run_with_timeout("order_points", 50, 0, timeout)
+    # A timeout or a crash is recorded as the whole timeout
+    seconds = timeout if result is None or result[0] is None else result[0]
+    results["order_points_50"] = seconds
+    return results
+
+
+def suite_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count(),
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance, noise_floor=0.005):
+    """
+    Prints new/baseline ratios of the timings both runs have and returns
+    the names that got slower by more than tolerance. Timings under
+    noise_floor seconds in both runs are not compared.
+    """
+    regressions = []
+    print(f"{'benchmark':<44} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, seconds in sorted(results.items()):
+        if name.endswith("/lands") or name not in baseline:
+            continue
+        before = baseline[name]
+        if max(before, seconds) < noise_floor:
+            continue
+        ratio = seconds / before if before > 0 else math.inf
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  slower"
+            regressions.append(name)
+        elif ratio < 1 / (1 + tolerance):
+            flag = "  faster"
+        print(f"{name:<44} {before:>10.4f} {seconds:>10.4f} {ratio:>6.2f}x"
+              f"{flag}")
+    return regressions
+
+
+def bench_suite(sizes, timeout, repeats=3, output=None, baseline=None,
+                tolerance=0.2):
+    """
+    Runs every workload repeats times and keeps the fastest timing of
+    each, then the kernels once. With output the results are saved as
+    JSON; with baseline (such a file) they are compared with it and the
+    process exits with 1 on regressions.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, clicks in suite_workloads(sizes):
+            for _ in range(repeats):
+                for metric, value in measure_workload(clicks,
+                                                      directory).items():
+                    key = f"{name}/{metric}"
+                    results[key] = min(results.get(key, value), value)
+            print(f"{name:<28} {results[name + '/clicks']:>9.3f} s clicks, "
+                  f"{results[name + '/lands']:>5} lands")
+    for metric, value in measure_kernels(timeout).items():
+        results[f"kernels/{metric}"] = value
+
+    if output:
+        with open(output, "w") as file:
+            json.dump({"meta": suite_metadata(), "results": results}, file,
+                      indent=2, sort_keys=True)
+        print(f"Saved to {output}")
+    if baseline:
+        with open(baseline) as file:
+            baseline_results = json.load(file)["results"]
+        regressions = compare_with_baseline(results, baseline_results,
+                                            tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks slower than the baseline "
+                  f"by more than {tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map generation benchmarks")
+    parser.add_argument("benchmark", choices=["ordering", "kernels", "boolean",
+                                              "ownership", "points", "mapfile",
+                                              "display", "tiles", "suite"])
+    parser.add_argument("--sizes", type=int, nargs="+")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--clicks", type=int, default=4000)
+    parser.add_argument("--world-size", type=float, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tile-cells", type=int, default=5)
+    parser.add_argument("--output", help="suite: save the results as JSON")
+    parser.add_argument("--baseline", help="suite: compare with results "
+                        "saved by an earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="suite: slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.benchmark == "ordering":
+        bench_ordering(args.sizes or [10, 50, 100, 200, 500], args.repeats,
+                       args.timeout)
+    elif args.benchmark == "kernels":
+        bench_kernels(args.sizes or [1000, 10000, 100000])
+    elif args.benchmark == "boolean":
+        bench_boolean(args.sizes or [100, 1000, 10000], args.repeats)
+    elif args.benchmark == "ownership":
+        bench_ownership(args.sizes or [1000, 100000, 1000000], args.clicks,
+                        args.world_size)
+    elif args.benchmark == "points":
+        bench_points(args.sizes or [10, 100, 1000])
+    elif args.benchmark == "mapfile":
+        bench_mapfile(args.sizes or [10000, 100000, 1000000])
+    elif args.benchmark == "display":
+        bench_display(args.sizes or [100, 1000, 10000], timeout=args.timeout)
+    elif args.benchmark == "suite":
+        bench_suite(args.sizes or [100, 1000], args.timeout, args.repeats,
+                    args.output, args.baseline, args.tolerance)
+    elif args.benchmark == "tiles":
+        bench_tiles(args.clicks, args.world_size, args.workers,
+                    args.tile_cells)
@@ -0,0 +1,930 @@
+import numpy as np
+from math import sqrt
+import math
+import os
+from spatial import PointGrid
+from history import EditJournal
+from mapfile import save_map
+from ownership import LandIndex
+from profiling import PROFILER
+from sampling import generate_area_coords
+from geometry import (convex_hull, cut_holes, find_crossings,
+                      intersection_point, order_ring,
+                      orientation as point_orientation, polygon_difference,
+                      polygon_union, repeated_vertices, ring_area,
+                      ring_crossings, rings_overlap, segments_intersect,
+                      segments_intersect_batch)
+
+
+class Point:
+    __slots__ = ("x", "y", "color", "failed_connections")
+
+    def __init__(self, x, y, color):
+        self.x = x
+        self.y = y
+        self.color = color
+        self.failed_connections = 0
+
+    def distance_from_other_point(self, other_point):
+        return sqrt((self.x - other_point.x)**2 + (self.y - other_point.y)**2)
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __repr__(self):
+        return f"Point({self.x}, {self.y})"
+
+
+class Line:
+
+    def __init__(self, point1, point2, color="red"):
+        self.p1 = point1
+        self.p2 = point2
+        self.color = color
+
+    def __repr__(self):
+        return f"Points({self.p1}, {self.p2})"
+
+    def intersects(self, other):
+        return segments_intersect((self.p1.x, self.p1.y), (self.p2.x, self.p2.y),
+                                  (other.p1.x, other.p1.y),
+                                  (other.p2.x, other.p2.y))
+
+    def intersection_point(self, other):
+        point = intersection_point((self.p1.x, self.p1.y),
+                                   (self.p2.x, self.p2.y),
+                                   (other.p1.x, other.p1.y),
+                                   (other.p2.x, other.p2.y))
+        if point is None:
+            return None
+        return Point(point[0], point[1], "yellow")
+
+
+class MapArea:
+
+    def __init__(self, x, y, size, seed=0, distribution="uniform"):
+        self.x = x
+        self.y = y
+        self.size = size
+        self.seed = seed
+        self.distribution = distribution
+        self.points_generated = False
+        self.points = []
+
+    def generate_points(self, num_points, area_size, color):
+        """
+        Losuje punkty komórki jednym wywołaniem z generatora wyznaczonego
+        przez (seed, x, y), więc komórkę można odtworzyć w każdej chwili.
+        """
+        if not self.points_generated:
+            coords = generate_area_coords(self.seed, self.x, self.y,
+                                          num_points, self.size,
+                                          self.distribution)
+            self.points = [Point(x, y, color) for x, y in coords.tolist()]
+            self.points_generated = True
+
+            return self.points
+        else:
+            return []
+
+
+def orientation(p, q, r):
+    """Return positive if p-q-r are clockwise, neg if counterclockwise, zero if collinear."""
+    return point_orientation((p.x, p.y), (q.x, q.y), (r.x, r.y))
+
+
+# Kolory landów trzymane jako liczby całkowite - indeksy w tej palecie
+COLORS = ["black", "red", "blue", "green", "yellow"]
+COLOR_IDS = {color: i for i, color in enumerate(COLORS)}
+
+
+def color_id(color):
+    if color not in COLOR_IDS:
+        COLOR_IDS[color] = len(COLORS)
+        COLORS.append(color)
+    return COLOR_IDS[color]
+
+
+class LandPoints:
+    """Widok na wierzchołki landu, tworzy obiekty Point dopiero przy odczycie."""
+
+    def __init__(self, land):
+        self.land = land
+
+    def __len__(self):
+        return len(self.land.coords)
+
+    def __getitem__(self, index):
+        color = self.land.color
+        if isinstance(index, slice):
+            return [Point(x, y, color) for x, y in self.land.coords[index].tolist()]
+        x, y = self.land.coords[index].tolist()
+        return Point(x, y, color)
+
+    def __iter__(self):
+        color = self.land.color
+        for x, y in self.land.coords.tolist():
+            yield Point(x, y, color)
+
+    def __contains__(self, point):
+        return (point.x, point.y) in self.land.vertex_set
+
+    def copy(self):
+        return list(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class LandLines:
+    """Widok na krawędzie landu, wynikające z kolejności wierzchołków."""
+
+    def __init__(self, land):
+        self.land = land
+
+    def __len__(self):
+        return len(self.land.coords)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        points = self.land.points
+        index = range(len(self))[index]
+        return Line(points[index], points[(index + 1) % len(self)],
+                    self.land.color)
+
+    def __iter__(self):
+        points = list(self.land.points)
+        for i in range(len(points)):
+            yield Line(points[i], points[(i + 1) % len(points)], self.land.color)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Land:
+    """
+    Land trzymany jako ciągła tablica współrzędnych (N, 2) i numer koloru.
+    Krawędzie wynikają z kolejności wierzchołków; points i lines to widoki.
+
+    Dane wyliczane ze współrzędnych (bbox, area, edges, vertex_set) są
+    liczone przy pierwszym odczycie i pamiętane do następnego przypisania
+    coords. Tablica coords nigdy nie jest zmieniana w miejscu, tylko
+    podmieniana (setter oznacza ją jako tylko do odczytu), więc to
+    wystarcza do unieważnienia.
+    """
+    def __init__(self, points, color):
+        self.color = color
+        self.points = points
+
+    @classmethod
+    def from_coords(cls, coords, color):
+        land = cls([], color)
+        land.coords = np.ascontiguousarray(coords, dtype=float).reshape(-1, 2)
+        return land
+
+    @property
+    def color(self):
+        return COLORS[self.color_id]
+
+    @color.setter
+    def color(self, color):
+        self.color_id = color_id(color)
+
+    @property
+    def coords(self):
+        return self._coords
+
+    @coords.setter
+    def coords(self, coords):
+        # Tablica jest współdzielona z historią i indeksami, więc zmiana
+        # w miejscu ma się skończyć błędem, a nie nieaktualnym cache
+        coords.flags.writeable = False
+        self._coords = coords
+        self._derived = {}
+
+    def _cached(self, name, compute):
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = compute(self._coords)
+        return value
+
+    @property
+    def bbox(self):
+        """(min_x, min_y, max_x, max_y) wierzchołków."""
+        return self._cached("bbox", lambda coords: (
+            tuple(coords.min(axis=0).tolist() + coords.max(axis=0).tolist())
+            if len(coords) else (0.0, 0.0, 0.0, 0.0)))
+
+    @property
+    def area(self):
+        """Pole ze znakiem, dodatnie dla obiegu przeciwnego do zegara."""
+        return self._cached("area", ring_area)
+
+    @property
+    def edges(self):
+        """Krawędzie jako tablica (N, 4): x1, y1, x2, y2."""
+        return self._cached("edges", lambda coords: np.hstack(
+            [coords, np.roll(coords, -1, axis=0)]))
+
+    @property
+    def vertex_set(self):
+        return self._cached("vertex_set",
+                            lambda coords: set(map(tuple, coords.tolist())))
+
+    @property
+    def points(self):
+        return LandPoints(self)
+
+    @points.setter
+    def points(self, points):
+        self.coords = np.array([(point.x, point.y) for point in points],
+                               dtype=float).reshape(-1, 2)
+
+    @property
+    def lines(self):
+        return LandLines(self)
+
+    def update_lines(self):
+        # Krawędzie nie są przechowywane; wyliczone dane są liczone od nowa
+        # przy następnym odczycie. Przypisanie coords robi to samo, więc
+        # edycje landu już tego nie wołają
+        self._derived = {}
+
+    def self_intersections(self):
+        """Zwraca pary indeksów krawędzi, które się przecinają."""
+        edges = self.edges
+        return find_crossings(edges[:, :2], edges[:, 2:])
+
+    def is_valid(self):
+        return (len(self.points) >= 3 and not self.self_intersections()
+                and not repeated_vertices(self.coords))
+
+    def delete_point(self, point):
+        matches = np.flatnonzero((self.coords[:, 0] == point.x)
+                                 & (self.coords[:, 1] == point.y))
+        if len(matches) == 0:
+            raise ValueError(f"{point} is not in land")
+        keep = np.ones(len(self.coords), dtype=bool)
+        keep[matches[0]] = False
+        self._keep_vertices(keep)
+
+    def delete_points(self, points):
+        """
+        Usuwa wszystkie podane wierzchołki naraz, zamiast po jednym jak
+        delete_point. Punkty spoza landu są pomijane. Zwraca liczbę
+        usuniętych wierzchołków i to, czy land mógł przy tym wyjść poza
+        dawny obrys (na sąsiednie landy).
+        """
+        removed = {(point.x, point.y) for point in points}
+        keep = np.array([vertex not in removed
+                         for vertex in map(tuple, self.coords.tolist())],
+                        dtype=bool)
+        count = len(keep) - int(keep.sum())
+        if not count:
+            return 0, False
+        return count, self._keep_vertices(keep)
+
+    def _keep_vertices(self, keep):
+        # Pozostałe wierzchołki zachowują kolejność obwodu, więc wklęsły
+        # land nie zmienia kształtu; order_ring porządkuje je od nowa tylko
+        # wtedy, gdy po usunięciu krawędzie się przecinają. Zwraca True,
+        # jeśli land mógł wyjść poza dawny obrys
+        coords = self.coords
+        kept = np.flatnonzero(keep)
+        remaining = coords[kept]
+        outgrown = False
+        if len(remaining) >= 3:
+            if ring_crossings(remaining):
+                remaining = remaining[order_ring(remaining)]
+                outgrown = True
+            else:
+                outgrown = _pockets_outside(coords, kept, self.area)
+        self.coords = remaining
+        return outgrown
+
+    def _set_outline(self, rings, cut=False, areas=None):
+        # Land to jeden pierścień bez dziur: zostaje największy zewnętrzny
+        # kontur, a dziury są wypełniane. Z cut=True dziury (po odjęciu
+        # obcego landu - to on w nich leży) są wycinane przez cut_holes.
+        # Pole odrzuconych konturów i kawałków z cut_holes nie znika po
+        # cichu: trafia do liczników outline.lost i outline.lost_area.
+        # Pole konturu trafia od razu do cache area
+        if areas is None:
+            areas = [ring_area(ring) for ring in rings]
+        if not rings or max(areas) <= 0:
+            self.coords = np.zeros((0, 2))
+            return
+        largest = int(np.argmax(areas))
+        outline = rings[largest]
+        lost = sum(area for area in areas if area > 0) - areas[largest]
+        holes = [ring for ring, area in zip(rings, areas) if area < 0]
+        if cut and holes:
+            outline, slots = cut_holes(outline, holes)
+            _count_lost(lost + slots)
+            self.coords = outline
+            return
+        _count_lost(lost)
+        self.coords = outline
+        self._derived["area"] = areas[largest]
+
+    def mini_grow(self, other_land, points_inside):
+        """
+        Przycina land do obszaru poza other_land, tak że oba landy dzielą
+        granicę zamiast na siebie nachodzić. Landy, które na siebie nie
+        nachodzą, zostają bez zmian bez liczenia różnicy.
+        """
+        with PROFILER.stage("mini_grow"):
+            if not rings_overlap(self.coords, other_land.coords):
+                PROFILER.count("mini_grow.skipped")
+                return
+            self._set_outline(polygon_difference(self.coords,
+                                                 other_land.coords), cut=True)
+
+    def grow_land(self, hull, points_inside, other_lands=None):
+        """
+        Łączy land z wielokątem hull (lista punktów albo land.points) w ich
+        sumę. Landy innych kolorów są odejmowane osobno przez mini_grow.
+        """
+        hull_coords = np.array([(point.x, point.y) for point in hull],
+                               dtype=float).reshape(-1, 2)
+        with PROFILER.stage("grow_land"):
+            rings = polygon_union(self.coords, hull_coords)
+        # Suma niepustych wielokątów nie może być pusta - jeśli wyszła pusta
+        # przez błąd numeryczny, land zostaje bez zmian
+        areas = [ring_area(ring) for ring in rings]
+        if any(area > 0 for area in areas):
+            self._set_outline(rings, areas=areas)
+
+
+def _count_lost(area):
+    if area > 0:
+        PROFILER.count("outline.lost", 1)
+        PROFILER.count("outline.lost_area", area)
+
+
+def _pockets_outside(coords, kept, area):
+    """
+    Czy pierścień z samych wierzchołków kept (indeksy coords, rosnąco)
+    może wychodzić poza coords o polu ze znakiem area. Każda cięciwa
+    między kolejnymi zachowanymi wierzchołkami odcina kieszeń z usuniętych;
+    land tylko się kurczy, jeśli każda kieszeń leży po jego wewnętrznej
+    stronie (pole tego samego znaku) i cięciwa nie przecina jej krawędzi.
+    """
+    sign = area > 0
+    n = len(coords)
+    following = np.roll(kept, -1)
+    for start, end in zip(kept.tolist(), following.tolist()):
+        if (end - start) % n == 1:
+            continue
+        pocket = coords[np.arange(start, start + (end - start) % n + 1) % n]
+        if (ring_area(pocket) > 0) != sign:
+            return True
+        chord_start = np.repeat(pocket[:1], len(pocket) - 1, axis=0)
+        chord_end = np.repeat(pocket[-1:], len(pocket) - 1, axis=0)
+        if segments_intersect_batch(chord_start, chord_end,
+                                    pocket[:-1], pocket[1:]).any():
+            return True
+    return False
+
+
+def order_points(points):
+    """
+    Porządkuje punkty w prosty (nieprzecinający się) wielokąt.
+
+    Zastępuje sort_points: jedno sortowanie kątowe wokół środka ciężkości,
+    O(n log n) i bez ponawiania prób.
+    """
+    if not points:
+        return []
+    order = order_ring([(point.x, point.y) for point in points])
+    return [points[i] for i in order]
+
+
+def sort_points(points):
+    banned_lines = []
+    banned_points = []
+    if not points:
+        return []
+
+    def next_point(current_point, points, used_points):
+        min_distance = float('inf')
+        next_p = None
+        for p in points:
+            if (p != current_point) and (p not in used_points) and (
+                    p not in banned_points):
+                dist = current_point.distance_from_other_point(p)
+                if dist < min_distance:
+                    valid = True
+                    if len(banned_lines) > 0:
+                        for line in banned_lines:
+                            if (next_p is not None) and (
+                                    (line.p1 == p and line.p2 == next_p) or
+                                    (line.p2 == p and line.p1 == next_p)):
+                                valid = False
+                                break
+                    if valid:
+                        min_distance = dist
+                        next_p = p
+        return next_p
+
+    start_point = points[0]
+    i = 0
+    thereIsIntersection = True
+    while thereIsIntersection:
+        PROFILER.count("sort_points.iterations")
+        used_points = set()
+        used_lines = []
+        current_point = start_point
+        sorted_points = []
+        banned_points = []
+
+        while len(sorted_points) < len(points) - len(banned_points):
+            sorted_points.append(current_point)
+            used_points.add(current_point)
+            found_better_point = False
+            if found_better_point == False:
+                next_p = next_point(current_point, points, used_points)
+            if next_p is None:
+                current_point.failed_connections += 1
+                if (current_point).failed_connections == 100:
+                    PROFILER.count("sort_points.banned_points")
+                    banned_points.append(banned_points)
+                    # points.remove(current_point)
+                i += 1
+                if (i > len(points)):
+                    i = 0
+                start_point = points[i]
+                break
+
+            used_lines.append(Line(current_point, next_p))
+            current_point = next_p
+
+        thereIsIntersection = False
+        # used_lines.append(Line(sorted_points[0],sorted_points[-1]))
+
+        # Dla każdej krawędzi banujemy ją razem z pierwszą krawędzią, którą
+        # przecina - tak jak dawna pętla po wszystkich parach
+        crossing_partner = {}
+        PROFILER.count("sort_points.intersection_tests", len(used_lines))
+        for i, j in find_crossings(
+                [(line.p1.x, line.p1.y) for line in used_lines],
+                [(line.p2.x, line.p2.y) for line in used_lines]):
+            crossing_partner[i] = min(crossing_partner.get(i, j), j)
+            crossing_partner[j] = min(crossing_partner.get(j, i), i)
+        for i, line in enumerate(used_lines):
+            if i in crossing_partner:
+                thereIsIntersection = True
+                banned_lines.append(line)
+                banned_lines.append(used_lines[crossing_partner[i]])
+                PROFILER.count("sort_points.banned_lines", 2)
+
+    return sorted_points
+
+
+def jarvis_marszuje(points, mapEditor, land_to_grow=None, points_inside=None):
+    n = len(points)
+    if n < 3:
+        return points
+
+    with PROFILER.stage("convex_hull"):
+        hull = [
+            points[i] for i in convex_hull(
+                [(point.x, point.y) for point in points],
+                mapEditor.hull_method)
+        ]
+    # Wszystkie punkty współliniowe - nie ma z czego zrobić landu
+    if len(hull) < 3:
+        return points
+
+    if land_to_grow == None:
+        land = Land(hull, mapEditor.color)
+        mapEditor.add_land(land)
+    else:
+        if (len(land_to_grow) == 1):
+            if land_to_grow[0].color == mapEditor.color:
+                land_to_grow[0].grow_land(hull, points_inside)
+            else:
+                land = Land(hull, mapEditor.color)
+                land.mini_grow(land_to_grow[0], points_inside)
+                # Hull w całości wewnątrz obcego landu nic nie dodaje
+                if len(land.coords) >= 3:
+                    mapEditor.add_land(land)
+
+        else:
+            new_land = Land(hull, mapEditor.color)
+            # Najpierw suma z landami tego samego koloru, potem odjęcie
+            # pozostałych, żeby nowy land na nie nie nachodził
+            for land in land_to_grow:
+                if land.color == mapEditor.color:
+                    new_land.grow_land(land.points.copy(), points_inside,
+                                       land_to_grow)
+                    mapEditor.remove_lands([land])
+            for land in land_to_grow:
+                if land.color != mapEditor.color:
+                    new_land.mini_grow(land, points_inside)
+
+            if len(new_land.coords) >= 3:
+                mapEditor.add_land(new_land)
+
+
+def save_lands_to_file(lands, filename, format=None):
+    """
+    Zapisuje landy do pliku. Format wynika z rozszerzenia (.pmap binarny,
+    .jsonl linie JSON, inne - lista obiektów JSON jak dotąd), patrz mapfile.
+    """
+    save_map(lands, filename, format)
+
+
+class MapEngine:
+    """
+    Stan mapy i logika kliknięć bez Tk i matplotlib - punkty, landy, pokrycie
+    MapArea i historia. MapEditor dokłada do niego okno, a generate.py
+    używa go bezpośrednio.
+    """
+
+    def __init__(self, plot_size=1000, rows=10, search_range=100,
+                 max_live_areas=None, keep_cells=None, page_dir=None,
+                 seed=None, distribution="uniform",
+                 undo_memory_budget=64 * 1024 * 1024):
+        self.mode = "write"
+        self.color = "red"
+        self.lands = []
+        self.plot_size = plot_size
+        self.search_range = search_range
+        self.range_of_adding = 1
+        self.hull_method = "monotone"
+        self.rows = rows
+        # Ziarno mapy - punkty każdej komórki zależą tylko od (seed, i, j)
+        self.seed = seed if seed is not None else int(np.random.randint(2**31))
+        self.distribution = distribution
+        self.points_per_area = 10
+        # Wolne punkty i wierzchołki landów trzymane w siatce o rozmiarze
+        # komórki MapArea, żeby kliknięcie nie przeglądało całej mapy
+        self.points = PointGrid(self.plot_size / self.rows)
+        self.land_vertices = PointGrid(self.plot_size / self.rows,
+                                       key=lambda item: (item[0].x, item[0].y))
+        self.indexed_vertices = {}
+        # land -> tablica coords, z której zbudowano jego wpisy w indeksach
+        self.indexed_coords = {}
+        # Który land zawiera dany punkt - prostokąty landów w siatce i test
+        # punktu w wielokącie
+        self.land_index = LandIndex(self.plot_size / self.rows)
+        # (i, j) -> MapArea dla komórek, których punkty są w pamięci
+        self.map_coverage = {}
+        # Komórki wyrzucone z pamięci: (i, j) -> tablica punktów albo plik
+        self.paged_areas = {}
+        # Powyżej max_live_areas komórek te dalsze niż keep_cells od
+        # kliknięcia są wyrzucane do paged_areas (albo na dysk do page_dir)
+        self.max_live_areas = max_live_areas
+        self.keep_cells = keep_cells if keep_cells is not None else rows
+        self.page_dir = page_dir
+        # Limit pamięci historii cofania w bajtach
+        self.history = EditJournal(undo_memory_budget)
+
+    @property
+    def undo_memory_budget(self):
+        """Limit pamięci historii cofania w bajtach (EditJournal.max_bytes)."""
+        return self.history.max_bytes
+
+    @undo_memory_budget.setter
+    def undo_memory_budget(self, max_bytes):
+        self.history.max_bytes = max_bytes
+
+    def is_point_used(self, point):
+        return len(self.land_vertices.query_radius(point.x, point.y, 0)) > 0
+
+    def add_point(self, p):
+        self.points.add(p)
+
+    def land_at(self, x, y):
+        """Zwraca land, który zawiera punkt (x, y), albo None."""
+        return self.land_index.land_at(x, y)
+
+    def lands_at(self, coords):
+        """Właściciel każdego punktu tablicy (N, 2) - land albo None."""
+        return self.land_index.lands_at(coords)
+
+    def index_land(self, land):
+        vertices = tuple(land.points)
+        for point in vertices:
+            self.land_vertices.add((point, land))
+        self.indexed_vertices[land] = vertices
+        self.indexed_coords[land] = land.coords
+        self.land_index.add(land)
+
+    def unindex_land(self, land):
+        for point in self.indexed_vertices.pop(land, ()):
+            self.land_vertices.discard((point, land))
+        self.indexed_coords.pop(land, None)
+        self.land_index.discard(land)
+
+    def reindex_land(self, land):
+        # Land, którego współrzędne się nie zmieniły, ma aktualne wpisy
+        if self.indexed_coords.get(land) is land.coords:
+            return
+        self.unindex_land(land)
+        self.index_land(land)
+
+    def rebuild_index(self):
+        self.land_vertices.clear()
+        self.indexed_vertices = {}
+        self.indexed_coords = {}
+        self.land_index = LandIndex(self.plot_size / self.rows)
+        for land in self.lands:
+            self.index_land(land)
+
+    def remove_lands(self, lands_to_remove):
+        # Zbiór zamiast listy - sprawdzanie "not in" po liście było O(n·m)
+        removed = set(lands_to_remove)
+        if not removed:
+            return
+        self.lands = [land for land in self.lands if land not in removed]
+        for land in lands_to_remove:
+            self.unindex_land(land)
+            self.history.land_removed(land)
+
+    def add_land(self, land):
+        self.lands.append(land)
+        self.index_land(land)
+        self.history.land_added(land)
+
+    def create_map_area(self, x, y):
+        if (x, y) in self.map_coverage:
+            return []
+        if (x, y) in self.paged_areas:
+            self.page_in_area(x, y)
+            return []
+        area = MapArea(x, y, self.plot_size / self.rows, self.seed,
+                       self.distribution)
+        self.map_coverage[(x, y)] = area
+        return [area]
+
+    def page_out_area(self, x, y):
+        """Przenosi wolne punkty komórki do zwartej tablicy (albo pliku)."""
+        del self.map_coverage[(x, y)]
+        points = self.points.pop_cell(x, y)
+        coords = np.array([(point.x, point.y) for point in points],
+                          dtype=float).reshape(-1, 2)
+        if self.page_dir is not None:
+            filename = os.path.join(self.page_dir, f"area_{x}_{y}.npy")
+            np.save(filename, coords)
+            self.paged_areas[(x, y)] = filename
+        else:
+            self.paged_areas[(x, y)] = coords
+
+    def page_in_area(self, x, y):
+        paged = self.paged_areas.pop((x, y))
+        if isinstance(paged, str):
+            coords = np.load(paged)
+            os.remove(paged)
+        else:
+            coords = paged
+        area = MapArea(x, y, self.plot_size / self.rows, self.seed,
+                       self.distribution)
+        area.points_generated = True
+        self.map_coverage[(x, y)] = area
+        self.points.extend(Point(px, py, "black") for px, py in coords.tolist())
+
+    def evict_far_areas(self, clicked_x, clicked_y):
+        if (self.max_live_areas is None
+                or len(self.map_coverage) <= self.max_live_areas):
+            return
+        area_size = self.plot_size / self.rows
+        center_i = math.floor(clicked_x / area_size)
+        center_j = math.floor(clicked_y / area_size)
+        for (i, j) in list(self.map_coverage):
+            if max(abs(i - center_i), abs(j - center_j)) > self.keep_cells:
+                self.page_out_area(i, j)
+
+    def click(self, clicked_x, clicked_y):
+        """Wykonuje kliknięcie w bieżącym trybie i zwraca edycję z historii."""
+        with PROFILER.stage("click"):
+            if self.mode == "delete":
+                return self.delete_at(clicked_x, clicked_y)
+            return self.write_at(clicked_x, clicked_y)
+
+    def delete_at(self, clicked_x, clicked_y):
+        self.history.begin()
+        self._delete_near([(clicked_x, clicked_y)])
+        with PROFILER.stage("history"):
+            return self.history.commit()
+
+    def _delete_near(self, centers):
+        """
+        Usuwa wierzchołki landów w zasięgu środków centers: jedno zapytanie
+        do siatki, jedno usunięcie na land. Landy, którym zostało mniej niż
+        3 wierzchołki, znikają z mapy.
+        """
+        # land -> jego wierzchołki w zasięgu
+        found = {}
+        for point, land in self.land_vertices.query_near(
+                centers, self.search_range / 10):
+            found.setdefault(land, []).append(point)
+        self.history.touch(found)
+        with PROFILER.stage("delete_points"):
+            too_small = []
+            grown = []
+            for land, points in found.items():
+                count, outgrown = land.delete_points(points)
+                PROFILER.count("delete_points.vertices", count)
+                if len(land.coords) < 3:
+                    too_small.append(land)
+                    continue
+                # Usunięty wklęsły wierzchołek wysuwa land poza dawny obrys,
+                # być może na sąsiedni land
+                if outgrown:
+                    grown.append(land)
+                self.reindex_land(land)
+            self.remove_lands(too_small)
+            for land in grown:
+                for other in list(self.land_index.boxes.query_box(
+                        *land.bbox)):
+                    if other is not land and len(land.coords) >= 3:
+                        land.mini_grow(other, [])
+                if len(land.coords) < 3:
+                    self.remove_lands([land])
+                else:
+                    self.reindex_land(land)
+
+    def generate_area_points(self, clicked_x, clicked_y):
+        for i in range(
+                math.floor((clicked_x - self.search_range) /
+                           (self.plot_size / self.rows)),
+                math.floor((clicked_x + self.search_range) /
+                           (self.plot_size / self.rows)) + 1):
+            for j in range(
+                    math.floor((clicked_y - self.search_range) /
+                               (self.plot_size / self.rows)),
+                    math.floor((clicked_y + self.search_range) /
+                               (self.plot_size / self.rows)) + 1):
+                adjacent_areas = self.create_map_area(i, j)
+                for area in adjacent_areas:
+                    new_points = area.generate_points(
+                        self.points_per_area, self.plot_size / self.rows,
+                        "black")
+                    self.points.extend(new_points)
+
+    def write_at(self, clicked_x, clicked_y):
+        with PROFILER.stage("generate_points"):
+            self.generate_area_points(clicked_x, clicked_y)
+        with PROFILER.stage("evict_areas"):
+            self.evict_far_areas(clicked_x, clicked_y)
+        self.history.begin()
+        self._write_near([(clicked_x, clicked_y)])
+        with PROFILER.stage("history"):
+            return self.history.commit()
+
+    def _write_near(self, centers, dirty=None):
+        """
+        Buduje land z punktów w zasięgu któregokolwiek ze środków centers,
+        tak jak jedno kliknięcie. Zmieniane landy trafiają do otwartej
+        edycji historii. Ze słownikiem dirty ich przeindeksowanie jest
+        odkładane: landy są do niego dopisywane zamiast reindex_land.
+        """
+        with PROFILER.stage("radius_scan"):
+            points_to_do = self.points.query_near(centers, self.search_range)
+
+            has_land_point = False
+            land_found = []
+            points_inside = []
+            seen_points = set()
+            for point, land in self.land_vertices.query_near(
+                    centers, self.search_range):
+                if point not in seen_points:
+                    seen_points.add(point)
+                    points_inside.append(point)
+                    point.color = "black"
+                    points_to_do.append(point)
+                has_land_point = True
+                if land in land_found:
+                    continue
+                land_found.append(land)
+            # Kliknięcie wewnątrz landu dotyka go nawet bez wierzchołka
+            # w zasięgu
+            owners = (self.lands_at(centers) if len(centers) > 1
+                      else [self.land_at(*centers[0])])
+            for owner in owners:
+                if owner is not None and owner not in land_found:
+                    land_found.append(owner)
+                    has_land_point = True
+        PROFILER.count("radius_scan.points", len(points_to_do))
+        PROFILER.count("radius_scan.lands", len(land_found))
+
+        self.history.touch(land_found)
+        with PROFILER.stage("jarvis_marszuje"):
+            if not has_land_point:
+                jarvis_marszuje(points_to_do, self)
+            else:
+                jarvis_marszuje(points_to_do, self, land_found, points_inside)
+
+        with PROFILER.stage("reindex"):
+            # Landy dodane w jarvis_marszuje są już zaindeksowane w add_land
+            for land in land_found:
+                if dirty is not None:
+                    dirty[land] = None
+                elif land in self.indexed_vertices:
+                    self.reindex_land(land)
+
+            for point in points_to_do:
+                if point in self.points:
+                    self.points.discard(point)
+                    self.history.point_removed(point)
+
+    def apply_clicks(self, clicks):
+        """
+        Wykonuje wiele kliknięć naraz ({"x", "y", "color", "mode"} jak
+        w generate.py) i zwraca jedną edycję historii albo None.
+
+        Kolejne kliknięcia o tym samym kolorze i trybie są grupowane: każde
+        jeszcze nieobsłużone kliknięcie zabiera wszystkie z serii leżące w
+        search_range od niego i cała grupa buduje jeden land z punktów w
+        zasięgu któregokolwiek z nich. Zamiast jednej przebudowy landów na
+        kliknięcie jest jedna na grupę, zmieniony land jest indeksowany dopiero
+        przed grupą, która może go dosięgnąć (albo na końcu serii), a historia
+        i rysowanie dostają jedną edycję na całą partię. Wynik może się więc
+        nieco różnić od tych samych kliknięć wykonanych po kolei.
+        """
+        self.history.begin()
+        run = []
+        for click in clicks:
+            click = (click["x"], click["y"], click.get("mode", self.mode),
+                     click.get("color", self.color))
+            if run and click[2:] != run[0][2:]:
+                self._apply_run(run)
+                run = []
+            run.append(click)
+        if run:
+            self._apply_run(run)
+        with PROFILER.stage("history"):
+            return self.history.commit()
+
+    def _apply_run(self, run):
+        self.mode, self.color = run[0][2:]
+        if self.mode == "delete":
+            self._delete_near([(x, y) for x, y, _, _ in run])
+            return
+        # Kliknięcia w siatce o boku search_range, żeby sąsiadów grupy
+        # szukać tylko w 3x3 komórkach
+        cell_size = self.search_range
+        cells = {}
+        for number, (x, y, _, _) in enumerate(run):
+            cells.setdefault((math.floor(x / cell_size),
+                              math.floor(y / cell_size)), []).append(number)
+        grouped = set()
+        # Landy zmienione w serii i jeszcze nieprzeindeksowane; land jest
+        # indeksowany dopiero, gdy kolejna grupa może go znaleźć
+        dirty = {}
+        for number, (x, y, _, _) in enumerate(run):
+            if number in grouped:
+                continue
+            i, j = math.floor(x / cell_size), math.floor(y / cell_size)
+            centers = []
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    for other in cells.get((i + di, j + dj), ()):
+                        other_x, other_y = run[other][:2]
+                        if other not in grouped and math.hypot(
+                                other_x - x, other_y - y) <= cell_size:
+                            grouped.add(other)
+                            centers.append((other_x, other_y))
+            with PROFILER.stage("generate_points"):
+                for center in centers:
+                    self.generate_area_points(*center)
+            with PROFILER.stage("evict_areas"):
+                self.evict_far_areas(x, y)
+            if dirty:
+                self._reindex_near(dirty, centers)
+            self._write_near(centers, dirty)
+        with PROFILER.stage("reindex"):
+            for land in dirty:
+                if land in self.indexed_vertices:
+                    self.reindex_land(land)
+
+    def _reindex_near(self, dirty, centers):
+        # Grupa znajduje land po wierzchołku w search_range albo po środku
+        # wewnątrz landu, więc wystarczy przeindeksować landy, których
+        # prostokąt powiększony o search_range obejmuje któryś ze środków
+        centers = np.array(centers, dtype=float)
+        reach = self.search_range
+        with PROFILER.stage("reindex"):
+            for land in list(dirty):
+                if land not in self.indexed_vertices:
+                    del dirty[land]
+                    continue
+                min_x, min_y, max_x, max_y = land.bbox
+                if ((centers[:, 0] >= min_x - reach)
+                        & (centers[:, 0] <= max_x + reach)
+                        & (centers[:, 1] >= min_y - reach)
+                        & (centers[:, 1] <= max_y + reach)).any():
+                    del dirty[land]
+                    self.reindex_land(land)
+
+    def undo(self):
+        return self.history.undo(self)
+
+    def redo(self):
+        return self.history.redo(self)
@@ -0,0 +1,316 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from geometry import polygon_intersection, ring_area, simplify_ring
+from mapfile import BinaryMap, detect_format, land_rings, open_map, ring_boxes
+
+
+class RingTable:
+    """
+    Lands held in memory with the query_box/boxes/indexing interface of
+    mapfile.BinaryMap, for maps that are not in the binary format.
+    """
+
+    def __init__(self, rings):
+        self.rings = [(np.asarray(coords, dtype=float).reshape(-1, 2), color)
+                      for coords, color in rings]
+        self.rings = [ring for ring in self.rings if len(ring[0])]
+        lengths = [len(coords) for coords, _ in self.rings]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+        coords = (np.concatenate([coords for coords, _ in self.rings])
+                  if self.rings else np.zeros((0, 2)))
+        self.land_boxes = ring_boxes(coords, offsets)
+
+    def boxes(self, indices):
+        return self.land_boxes[np.asarray(indices, dtype=int)]
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        boxes = self.land_boxes
+        return np.flatnonzero((boxes[:, 0] <= max_x) & (min_x <= boxes[:, 2])
+                              & (boxes[:, 1] <= max_y) & (min_y <= boxes[:, 3]))
+
+    def __len__(self):
+        return len(self.rings)
+
+    def __getitem__(self, index):
+        return self.rings[index]
+
+
+def open_source(source):
+    """
+    Lands to export: a map file name (binary files are memory-mapped, the
+    other formats read into memory) or lands / (coords, color) pairs.
+    """
+    if isinstance(source, (BinaryMap, RingTable)):
+        return source
+    if isinstance(source, str):
+        if detect_format(source) == "binary":
+            return BinaryMap(source)
+        return RingTable(open_map(source))
+    return RingTable(land_rings(source))
+
+
+def map_bounds(lands):
+    """(min_x, min_y, max_x, max_y) of every land of an open_source map."""
+    if len(lands) == 0:
+        return (0.0, 0.0, 1.0, 1.0)
+    boxes = lands.boxes(np.arange(len(lands)))
+    return (float(boxes[:, 0].min()), float(boxes[:, 1].min()),
+            float(boxes[:, 2].max()), float(boxes[:, 3].max()))
+
+
+# Map of the current pool worker, opened once by _init_worker
+_LANDS = None
+
+
+def _init_worker(source):
+    global _LANDS
+    # A BinaryMap is reopened from its file instead of pickling the memmaps
+    if isinstance(source, BinaryMap):
+        source = source.filename
+    _LANDS = open_source(source)
+
+
+def _run(function, jobs, source, workers):
+    """Runs function over jobs in this process or in a pool of workers."""
+    if workers == 1:
+        _init_worker(source)
+        for job in jobs:
+            yield function(job)
+        return
+    if isinstance(source, BinaryMap):
+        source = source.filename
+    with multiprocessing.Pool(workers, _init_worker, (source,)) as pool:
+        yield from pool.imap_unordered(function, jobs)
+
+
+def rasterize(lands, bounds, width, height, first_row=0, last_row=None):
+    """
+    Label grid of rows first_row:last_row of a width x height raster of
+    bounds (min_x, min_y, max_x, max_y), row 0 at the top: each pixel holds
+    1 + the index of the land covering its center, or 0.
+
+    Every land is filled with a scanline pass over its edges: for each
+    pixel row an edge spans, the crossing x is computed in one vectorized
+    step, crossings are sorted by row and x, and consecutive pairs are the
+    runs inside the land (even-odd rule). Lands are expected not to
+    overlap; where they do, the later land wins.
+    """
+    last_row = height if last_row is None else last_row
+    min_x, min_y, max_x, max_y = bounds
+    pixel_width = (max_x - min_x) / width
+    pixel_height = (max_y - min_y) / height
+    labels = np.zeros((last_row - first_row, width), dtype=np.int32)
+    band_top = max_y - first_row * pixel_height
+    band_bottom = max_y - last_row * pixel_height
+
+    for index in lands.query_box(min_x, band_bottom, max_x, band_top):
+        coords, _ = lands[index]
+        coords = np.asarray(coords, dtype=float)
+        if len(coords) < 3:
+            continue
+        starts = coords
+        ends = np.roll(coords, -1, axis=0)
+        low = np.minimum(starts[:, 1], ends[:, 1])
+        high = np.maximum(starts[:, 1], ends[:, 1])
+        # Rows whose center y lies in [low, high) of an edge
+        first = np.floor((max_y - high) / pixel_height - 0.5).astype(np.int64) + 1
+        last = np.floor((max_y - low) / pixel_height - 0.5).astype(np.int64)
+        first = np.maximum(first, first_row)
+        last = np.minimum(last, last_row - 1)
+        counts = np.maximum(last - first + 1, 0)
+        if counts.sum() == 0:
+            continue
+        edge_ids = np.repeat(np.arange(len(coords)), counts)
+        rows = (np.repeat(first, counts) + np.arange(len(edge_ids))
+                - np.repeat(np.cumsum(counts) - counts, counts))
+        y = max_y - (rows + 0.5) * pixel_height
+        ax, ay = starts[edge_ids, 0], starts[edge_ids, 1]
+        bx, by = ends[edge_ids, 0], ends[edge_ids, 1]
+        x = ax + (y - ay) * (bx - ax) / (by - ay)
+
+        order = np.lexsort((x, rows))
+        rows, x = rows[order], x[order]
+        # Columns whose center x lies in [run start, run end)
+        columns = np.ceil((x - min_x) / pixel_width - 0.5).astype(np.int64)
+        columns = np.clip(columns, 0, width)
+        run_rows = rows[0::2] - first_row
+        run_starts, run_ends = columns[0::2], columns[1::2]
+        keep = run_ends > run_starts
+        run_rows, run_starts, run_ends = (run_rows[keep], run_starts[keep],
+                                          run_ends[keep])
+        if len(run_rows) == 0:
+            continue
+        # Runs are filled through a difference array over the land's
+        # columns, so the cost is the land's box, not the whole band
+        low_column, high_column = run_starts.min(), run_ends.max()
+        low_row, high_row = run_rows.min(), run_rows.max() + 1
+        changes = np.zeros((high_row - low_row, high_column - low_column + 1),
+                           dtype=np.int32)
+        np.add.at(changes, (run_rows - low_row, run_starts - low_column), 1)
+        np.add.at(changes, (run_rows - low_row, run_ends - low_column), -1)
+        inside = np.cumsum(changes, axis=1)[:, :-1] > 0
+        labels[low_row:high_row, low_column:high_column][inside] = index + 1
+    return labels
+
+
+def _raster_band(job):
+    filename, bounds, width, height, first_row, last_row = job
+    raster = np.load(filename, mmap_mode="r+")
+    raster[first_row:last_row] = rasterize(_LANDS, bounds, width, height,
+                                           first_row, last_row)
+    raster.flush()
+    return first_row, last_row
+
+
+def export_labels(source, filename, width, height, bounds=None,
+                  chunk_rows=512, workers=None):
+    """
+    Writes the label grid of a map (see rasterize) to a .npy file, chunk_rows
+    rows at a time, so the raster never has to fit in memory. With workers
+    the bands are rasterized in a process pool and written in place. A
+    JSON file next to it (filename + ".json") gives the bounds and the
+    color of each label.
+    """
+    lands = open_source(source)
+    bounds = tuple(bounds) if bounds is not None else map_bounds(lands)
+    raster = np.lib.format.open_memmap(filename, mode="w+", dtype=np.int32,
+                                       shape=(height, width))
+    del raster
+    jobs = [(filename, bounds, width, height, row,
+             min(row + chunk_rows, height))
+            for row in range(0, height, chunk_rows)]
+    for _ in _run(_raster_band, jobs, lands, workers):
+        pass
+    with open(filename + ".json", "w") as file:
+        json.dump({"bounds": bounds, "width": width, "height": height,
+                   "colors": [None] + [color for _, color in lands]}, file)
+    return bounds
+
+
+def _tile_row(job):
+    """Writes the tiles of one row of a zoom level; returns how many."""
+    directory, bounds, zoom, y, columns, tile_pixels = job
+    min_x, _, max_x, max_y = bounds
+    tile_size = (max_x - min_x) / 2**zoom
+    tolerance = tile_size / tile_pixels
+    simplified = {}
+    written = 0
+    for x in columns:
+        box = (min_x + x * tile_size, max_y - (y + 1) * tile_size,
+               min_x + (x + 1) * tile_size, max_y - y * tile_size)
+        square = np.array([box[:2], (box[2], box[1]), box[2:],
+                           (box[0], box[3])])
+        features = []
+        for index in _LANDS.query_box(*box):
+            index = int(index)
+            coords, color = _LANDS[index]
+            if index not in simplified:
+                simplified[index] = simplify_ring(coords, tolerance)
+            ring = simplified[index]
+            if len(ring) < 3:
+                continue
+            land_box = _LANDS.boxes([index])[0]
+            if (box[0] <= land_box[0] and land_box[2] <= box[2]
+                    and box[1] <= land_box[1] and land_box[3] <= box[3]):
+                rings = [ring]
+            else:
+                rings = [part for part in polygon_intersection(ring, square)
+                         if ring_area(part) > 0]
+            if rings:
+                features.append({"id": index, "color": color,
+                                 "rings": [np.asarray(part).tolist()
+                                           for part in rings]})
+        if not features:
+            continue
+        os.makedirs(os.path.join(directory, str(zoom), str(x)), exist_ok=True)
+        with open(os.path.join(directory, str(zoom), str(x), f"{y}.json"),
+                  "w") as file:
+            file.write(json.dumps({"z": zoom, "x": x, "y": y, "bounds": box,
+                                   "lands": features}))
+        written += 1
+    return written
+
+
+def export_tiles(source, directory, max_zoom, bounds=None, tile_pixels=256,
+                 workers=None):
+    """
+    Writes a tile pyramid of a map: for zoom levels 0..max_zoom the square
+    bounds are cut into 2**zoom x 2**zoom tiles, and each tile with lands
+    becomes directory/zoom/x/y.json with the lands simplified to about a
+    pixel of a tile_pixels wide tile and clipped to the tile. y counts from
+    the top. Rows of tiles are written in a process pool with workers.
+    Returns the number of tiles written.
+    """
+    lands = open_source(source)
+    if bounds is None:
+        min_x, min_y, max_x, max_y = map_bounds(lands)
+        side = max(max_x - min_x, max_y - min_y) or 1.0
+        bounds = (min_x, max_y - side, min_x + side, max_y)
+    bounds = tuple(bounds)
+    min_x, min_y, max_x, max_y = bounds
+    boxes = lands.boxes(np.arange(len(lands)))
+    jobs = []
+    for zoom in range(max_zoom + 1):
+        count = 2**zoom
+        tile_size = (max_x - min_x) / count
+        # Tiles under each land's box, so empty tiles are never visited
+        first_x = np.clip(np.floor((boxes[:, 0] - min_x) / tile_size), 0,
+                          count - 1).astype(int)
+        last_x = np.clip(np.floor((boxes[:, 2] - min_x) / tile_size), 0,
+                         count - 1).astype(int)
+        first_y = np.clip(np.floor((max_y - boxes[:, 3]) / tile_size), 0,
+                          count - 1).astype(int)
+        last_y = np.clip(np.floor((max_y - boxes[:, 1]) / tile_size), 0,
+                         count - 1).astype(int)
+        rows = {}
+        for x0, x1, y0, y1 in zip(first_x.tolist(), last_x.tolist(),
+                                  first_y.tolist(), last_y.tolist()):
+            for y in range(y0, y1 + 1):
+                rows.setdefault(y, set()).update(range(x0, x1 + 1))
+        jobs.extend((directory, bounds, zoom, y, sorted(columns), tile_pixels)
+                    for y, columns in sorted(rows.items()))
+    os.makedirs(directory, exist_ok=True)
+    written = sum(_run(_tile_row, jobs, lands, workers))
+    with open(os.path.join(directory, "tiles.json"), "w") as file:
+        json.dump({"bounds": bounds, "max_zoom": max_zoom,
+                   "tile_pixels": tile_pixels, "tiles": written}, file)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export a map as a label raster and/or a tile pyramid")
+    parser.add_argument("source", help="map file in any format")
+    parser.add_argument("--raster", help="write the label grid to this .npy")
+    parser.add_argument("--width", type=int, default=1000)
+    parser.add_argument("--height", type=int, default=1000)
+    parser.add_argument("--chunk-rows", type=int, default=512,
+                        help="raster rows rendered at a time")
+    parser.add_argument("--tiles", help="write a tile pyramid to this directory")
+    parser.add_argument("--max-zoom", type=int, default=4)
+    parser.add_argument("--tile-pixels", type=int, default=256)
+    parser.add_argument("--bounds", type=float, nargs=4,
+                        metavar=("MIN_X", "MIN_Y", "MAX_X", "MAX_Y"),
+                        help="area to export (default: all lands)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to use (0: one per CPU)")
+    args = parser.parse_args()
+    workers = args.workers or None
+    if args.raster:
+        bounds = export_labels(args.source, args.raster, args.width,
+                               args.height, args.bounds, args.chunk_rows,
+                               workers)
+        print(f"{args.raster}: {args.width}x{args.height} labels of {bounds}")
+    if args.tiles:
+        written = export_tiles(args.source, args.tiles, args.max_zoom,
+                               args.bounds, args.tile_pixels, workers)
+        print(f"{args.tiles}: {written} tiles, zoom 0-{args.max_zoom}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+
+from engine import MapEngine, save_lands_to_file
+from history import EditJournal
+from profiling import PROFILER
+from sampling import DISTRIBUTIONS
+from tiling import generate_tiled
+
+
+def random_clicks(count, seed, world_size, colors, delete_ratio=0.0):
+    """Seeded random click sequence in the [0, world_size) square."""
+    rng = np.random.RandomState(seed)
+    for _ in range(count):
+        yield {
+            "x": float(rng.uniform(0, world_size)),
+            "y": float(rng.uniform(0, world_size)),
+            "color": colors[rng.randint(len(colors))],
+            "mode": "delete" if rng.random_sample() < delete_ratio else "write",
+        }
+
+
+def read_clicks(filename):
+    """Clicks from a JSON-lines file: {"x": .., "y": .., "color": .., "mode": ..}."""
+    with open(filename) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def run_clicks(engine, clicks, record=None, batch=None):
+    """
+    Replays clicks on the engine and returns how many were applied. With
+    batch, clicks go to MapEngine.apply_clicks that many at a time.
+    """
+    if batch:
+        return run_batches(engine, clicks, record, batch)
+    count = 0
+    for click in clicks:
+        engine.mode = click.get("mode", engine.mode)
+        engine.color = click.get("color", engine.color)
+        engine.click(click["x"], click["y"])
+        if record is not None:
+            record.write(json.dumps(click) + "\n")
+        count += 1
+    return count
+
+
+def run_batches(engine, clicks, record, batch):
+    count = 0
+    clicks = iter(clicks)
+    while True:
+        chunk = list(itertools.islice(clicks, batch))
+        if not chunk:
+            return count
+        engine.apply_clicks(chunk)
+        if record is not None:
+            for click in chunk:
+                record.write(json.dumps(click) + "\n")
+        count += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate maps without the editor window")
+    parser.add_argument("--clicks", type=int, default=1000,
+                        help="number of random clicks to generate")
+    parser.add_argument("--script", help="JSON-lines file of clicks to replay "
+                        "instead of random ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--world-size", type=float, default=1000)
+    parser.add_argument("--distribution", default="uniform",
+                        choices=sorted(DISTRIBUTIONS),
+                        help="how free points are placed in a map cell")
+    parser.add_argument("--colors", nargs="+",
+                        default=["red", "blue", "green", "yellow"])
+    parser.add_argument("--delete-ratio", type=float, default=0.0)
+    parser.add_argument("--record", help="write the replayed clicks to this "
+                        "JSON-lines file")
+    parser.add_argument("--batch", type=int,
+                        help="apply this many clicks at a time, merging "
+                        "nearby clicks of one color into one land update")
+    parser.add_argument("--workers", type=int,
+                        help="generate tiles in this many processes and merge "
+                        "them along tile borders")
+    parser.add_argument("--tile-cells", type=int, default=5,
+                        help="tile width in MapArea cells for --workers")
+    parser.add_argument("--output", default="lands_data.txt")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage timings and counters (only "
+                        "stages run in this process, not in --workers)")
+    parser.add_argument("--profile-json",
+                        help="write the profile summary to this JSON file")
+    parser.add_argument("--trace", help="write a Chrome trace of every stage "
+                        "to this JSON file")
+    args = parser.parse_args()
+    if args.profile or args.profile_json or args.trace:
+        PROFILER.enable(trace=bool(args.trace))
+
+    engine = MapEngine(seed=args.seed, distribution=args.distribution)
+    # Nobody can undo without the window, so keep only the last edit
+    engine.history = EditJournal(max_bytes=0)
+    if args.script:
+        clicks = read_clicks(args.script)
+    else:
+        clicks = random_clicks(args.clicks, args.seed, args.world_size,
+                               args.colors, args.delete_ratio)
+
+    if args.workers:
+        clicks = list(clicks)
+        if args.record:
+            with open(args.record, "w") as record:
+                for click in clicks:
+                    record.write(json.dumps(click) + "\n")
+        start = time.perf_counter()
+        engine = generate_tiled(clicks, args.seed, args.tile_cells,
+                                args.workers,
+                                {"distribution": args.distribution})
+        count = len(clicks)
+        elapsed = time.perf_counter() - start
+    else:
+        record = open(args.record, "w") if args.record else None
+        start = time.perf_counter()
+        try:
+            count = run_clicks(engine, clicks, record, args.batch)
+        finally:
+            if record is not None:
+                record.close()
+        elapsed = time.perf_counter() - start
+    save_lands_to_file(engine.lands, args.output)
+
+    elapsed = max(elapsed, 1e-9)
+    print(f"{count} clicks, {len(engine.lands)} lands in {elapsed:.2f} s: "
+          f"{count / elapsed:.1f} clicks/s, "
+          f"{len(engine.lands) / elapsed:.1f} lands/s")
+    print(f"Saved to {args.output}")
+    if args.profile:
+        print(PROFILER.report())
+    if args.profile_json:
+        PROFILER.export_json(args.profile_json)
+    if args.trace:
+        PROFILER.export_chrome_trace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
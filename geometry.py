@@ -0,0 +1,1001 @@
+import heapq
+import math
+
+import numpy as np
+
+
+def order_ring(coords):
+    """
+    Return indices that order (N, 2) coordinates into a simple polygon ring.
+
+    Points are sorted by angle around their centroid, ties by distance, so
+    the ring is star-shaped around the centroid and never self-intersects.
+    Duplicate coordinates are dropped. The work is a single O(n log n)
+    sort, there are no retries.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) == 0:
+        return np.zeros(0, dtype=np.intp)
+    _, first_index = np.unique(coords, axis=0, return_index=True)
+    unique_index = np.sort(first_index)
+    if len(unique_index) < 3:
+        return unique_index
+    unique_coords = coords[unique_index]
+    offsets = unique_coords - unique_coords.mean(axis=0)
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    distances = np.hypot(offsets[:, 0], offsets[:, 1])
+    return unique_index[np.lexsort((distances, angles))]
+
+
+def _as_points(points):
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+
+def orientations(p, q, r):
+    """
+    Orientation of every p-q-r triple of (N, 2) arrays: 1 if clockwise,
+    -1 if counterclockwise, 0 if collinear.
+    """
+    p, q, r = _as_points(p), _as_points(q), _as_points(r)
+    val = ((q[:, 1] - p[:, 1]) * (r[:, 0] - q[:, 0]) -
+           (q[:, 0] - p[:, 0]) * (r[:, 1] - q[:, 1]))
+    return np.sign(val).astype(np.int8)
+
+
+def _on_segments(p, q, r):
+    return ((q[:, 0] <= np.maximum(p[:, 0], r[:, 0]))
+            & (q[:, 0] >= np.minimum(p[:, 0], r[:, 0]))
+            & (q[:, 1] <= np.maximum(p[:, 1], r[:, 1]))
+            & (q[:, 1] >= np.minimum(p[:, 1], r[:, 1])))
+
+
+def segments_intersect_batch(p1, p2, q1, q2):
+    """
+    Boolean mask telling which segments p1-p2 intersect segments q1-q2.
+
+    Follows the rules of Line.intersects: segments that share an endpoint
+    never count as intersecting, touching and collinear overlap do.
+    """
+    p1, p2, q1, q2 = _as_points(p1), _as_points(p2), _as_points(q1), _as_points(q2)
+    o1 = orientations(p1, p2, q1)
+    o2 = orientations(p1, p2, q2)
+    o3 = orientations(q1, q2, p1)
+    o4 = orientations(q1, q2, p2)
+    shared = ((p1 == q1).all(axis=1) | (p1 == q2).all(axis=1)
+              | (p2 == q1).all(axis=1) | (p2 == q2).all(axis=1))
+    general = (o1 != o2) & (o3 != o4)
+    collinear = (((o1 == 0) & _on_segments(p1, q1, p2))
+                 | ((o2 == 0) & _on_segments(p1, q2, p2))
+                 | ((o3 == 0) & _on_segments(q1, p1, q2))
+                 | ((o4 == 0) & _on_segments(q1, p2, q2)))
+    return ~shared & (general | collinear)
+
+
+def intersection_points(p1, p2, q1, q2):
+    """
+    Intersection of the infinite lines through p1-p2 and q1-q2 as an
+    (N, 2) array; rows of parallel lines are NaN.
+    """
+    p1, p2, q1, q2 = _as_points(p1), _as_points(p2), _as_points(q1), _as_points(q2)
+    a1 = p2[:, 1] - p1[:, 1]
+    b1 = p1[:, 0] - p2[:, 0]
+    c1 = a1 * p1[:, 0] + b1 * p1[:, 1]
+    a2 = q2[:, 1] - q1[:, 1]
+    b2 = q1[:, 0] - q2[:, 0]
+    c2 = a2 * q1[:, 0] + b2 * q1[:, 1]
+    det = a1 * b2 - a2 * b1
+    result = np.full((len(det), 2), np.nan)
+    nonzero = det != 0
+    result[nonzero, 0] = (b2 * c1 - b1 * c2)[nonzero] / det[nonzero]
+    result[nonzero, 1] = (a1 * c2 - a2 * c1)[nonzero] / det[nonzero]
+    return result
+
+
+def orientation(p, q, r):
+    """Orientation of a single p-q-r triple of (x, y) pairs, as orientations."""
+    val = (q[1] - p[1]) * (r[0] - q[0]) - (q[0] - p[0]) * (r[1] - q[1])
+    if val > 0:
+        return 1
+    return -1 if val < 0 else 0
+
+
+def _on_segment(p, q, r):
+    return (min(p[0], r[0]) <= q[0] <= max(p[0], r[0])
+            and min(p[1], r[1]) <= q[1] <= max(p[1], r[1]))
+
+
+def segments_intersect(p1, p2, q1, q2):
+    """
+    Single-segment form of segments_intersect_batch, in plain floats so
+    one test does not pay for building arrays.
+    """
+    p1, p2, q1, q2 = tuple(p1), tuple(p2), tuple(q1), tuple(q2)
+    if p1 == q1 or p1 == q2 or p2 == q1 or p2 == q2:
+        return False
+    o1 = orientation(p1, p2, q1)
+    o2 = orientation(p1, p2, q2)
+    o3 = orientation(q1, q2, p1)
+    o4 = orientation(q1, q2, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and _on_segment(p1, q1, p2))
+            or (o2 == 0 and _on_segment(p1, q2, p2))
+            or (o3 == 0 and _on_segment(q1, p1, q2))
+            or (o4 == 0 and _on_segment(q1, p2, q2)))
+
+
+def intersection_point(p1, p2, q1, q2):
+    """
+    Single-pair form of intersection_points in plain floats; None for
+    parallel lines.
+    """
+    a1 = p2[1] - p1[1]
+    b1 = p1[0] - p2[0]
+    c1 = a1 * p1[0] + b1 * p1[1]
+    a2 = q2[1] - q1[1]
+    b2 = q1[0] - q2[0]
+    c2 = a2 * q1[0] + b2 * q1[1]
+    det = a1 * b2 - a2 * b1
+    if det == 0:
+        return None
+    return (b2 * c1 - b1 * c2) / det, (a1 * c2 - a2 * c1) / det
+
+
+def _grid_pairs(starts, ends, max_pairs=None):
+    """
+    (K, 2) array of all i < j pairs of segments whose bounding boxes
+    overlap, or None if the grid would need more than max_pairs entries
+    or pairs.
+
+    Boxes are registered in every cell of a uniform grid they cover and
+    pairs are only formed inside a cell. The cell is the mean segment
+    size, so a short segment covers one cell or a few. A pair is kept only
+    in the cell holding the lower left corner of the two boxes' overlap,
+    so it comes out once.
+    """
+    n = len(starts)
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.intp)
+    low = np.minimum(starts, ends)
+    high = np.maximum(starts, ends)
+    origin = low.min(axis=0)
+    extent = float((high.max(axis=0) - origin).max())
+    sizes = (high - low).max(axis=1)
+    cell = float(sizes.mean()) or extent / math.sqrt(n) or 1.0
+    first = np.floor((low - origin) / cell).astype(np.int64)
+    last = np.floor((high - origin) / cell).astype(np.int64)
+    columns = int(last[:, 1].max()) + 1
+
+    # One entry per (segment, cell) under its box
+    spans = last - first + 1
+    counts = spans[:, 0] * spans[:, 1]
+    if max_pairs is not None and counts.sum() > max_pairs:
+        return None
+    segment = np.repeat(np.arange(n), counts)
+    step = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts,
+                                               counts)
+    cell_x = first[segment, 0] + step // spans[segment, 1]
+    cell_y = first[segment, 1] + step % spans[segment, 1]
+    keys = cell_x * columns + cell_y
+    order = np.argsort(keys, kind="stable")
+    keys, segment = keys[order], segment[order]
+
+    # Every entry is paired with the entries after it in the same cell
+    group_end = np.searchsorted(keys, keys, side="right")
+    later = group_end - np.arange(len(keys)) - 1
+    if max_pairs is not None and later.sum() > max_pairs:
+        return None
+    left = np.repeat(np.arange(len(keys)), later)
+    right = left + 1 + (np.arange(len(left))
+                        - np.repeat(np.cumsum(later) - later, later))
+    i, j = segment[left], segment[right]
+    cell_keys = keys[left]
+
+    overlap = ((low[i, 0] <= high[j, 0]) & (low[j, 0] <= high[i, 0])
+               & (low[i, 1] <= high[j, 1]) & (low[j, 1] <= high[i, 1]))
+    corner = np.floor((np.maximum(low[i], low[j]) - origin) / cell).astype(
+        np.int64)
+    owned = corner[:, 0] * columns + corner[:, 1] == cell_keys
+    keep = overlap & owned & (i != j)
+    i, j = i[keep], j[keep]
+    return np.column_stack([np.minimum(i, j), np.maximum(i, j)]).astype(np.intp)
+
+
+def _sweep_pairs(starts, ends):
+    """
+    Pairs of segments that may intersect, found with a Bentley-Ottmann
+    sweep in O((n + k) log n) for k intersections: segments are kept in
+    the order they cross a vertical line moving left to right, and only
+    neighbours in that order are compared. All segments meeting at an event
+    point are paired with each other, which covers shared endpoints,
+    touching and collinear overlap. The pairs are a superset of the
+    intersecting ones, to be tested exactly by the caller.
+    """
+    segments = []
+    events = set()
+    starting = {}
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        start, end = tuple(start), tuple(end)
+        if end < start:
+            start, end = end, start
+        segments.append((start, end))
+        starting.setdefault(start, []).append(i)
+        events.add(start)
+        events.add(end)
+    queue = list(events)
+    heapq.heapify(queue)
+    scale = float(np.abs(starts).max()) if len(starts) else 0.0
+    tolerance = 1e-9 * (1 + scale)
+    pairs = set()
+    status = []
+
+    def y_at(i, x, y):
+        (ax, ay), (bx, by) = segments[i]
+        if ax == bx:
+            # A vertical segment sits at the event point while it spans it
+            return min(max(y, ay), by)
+        if x == ax:
+            return ay
+        if x == bx:
+            return by
+        return ay + (x - ax) * (by - ay) / (bx - ax)
+
+    def first_above(x, y, limit):
+        low, high = 0, len(status)
+        while low < high:
+            middle = (low + high) // 2
+            if y_at(status[middle], x, y) < limit:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def first_beyond(x, y, limit):
+        low, high = 0, len(status)
+        while low < high:
+            middle = (low + high) // 2
+            if y_at(status[middle], x, y) <= limit:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def slope(i):
+        (ax, ay), (bx, by) = segments[i]
+        return math.inf if ax == bx else (by - ay) / (bx - ax)
+
+    def check(i, j, point):
+        (ax, ay), (bx, by) = segments[i]
+        (cx, cy), (dx, dy) = segments[j]
+        if (max(ax, bx) < min(cx, dx) - tolerance
+                or max(cx, dx) < min(ax, bx) - tolerance
+                or max(ay, by) < min(cy, dy) - tolerance
+                or max(cy, dy) < min(ay, by) - tolerance):
+            return
+        pairs.add((min(i, j), max(i, j)))
+        o1 = _cross((ax, ay), (bx, by), (cx, cy))
+        o2 = _cross((ax, ay), (bx, by), (dx, dy))
+        o3 = _cross((cx, cy), (dx, dy), (ax, ay))
+        o4 = _cross((cx, cy), (dx, dy), (bx, by))
+        if o1 * o2 < 0 and o3 * o4 < 0:
+            t = o3 / (o3 - o4)
+            crossing = (ax + t * (bx - ax), ay + t * (by - ay))
+            if crossing > point and crossing not in events:
+                events.add(crossing)
+                heapq.heappush(queue, crossing)
+
+    while queue:
+        point = heapq.heappop(queue)
+        x, y = point
+        low = first_above(x, y, y - tolerance)
+        high = first_beyond(x, y, y + tolerance)
+        through = status[low:high]
+        begin = starting.get(point, [])
+        meeting = through + begin
+        for a in range(len(meeting)):
+            for b in range(a + 1, len(meeting)):
+                i, j = meeting[a], meeting[b]
+                pairs.add((min(i, j), max(i, j)))
+        # Segments going on to the right of the point, bottom to top
+        going_on = [i for i in through if segments[i][1] != point]
+        going_on += [i for i in begin if segments[i][1] != point]
+        going_on.sort(key=lambda i: (slope(i), i))
+        status[low:high] = going_on
+        if not going_on:
+            if 0 < low < len(status):
+                check(status[low - 1], status[low], point)
+            continue
+        if low > 0:
+            check(status[low - 1], going_on[0], point)
+        last = low + len(going_on)
+        if last < len(status):
+            check(going_on[-1], status[last], point)
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.intp)
+    return np.array(sorted(pairs), dtype=np.intp)
+
+
+def _candidate_pairs(starts, ends):
+    """
+    (K, 2) array of i < j pairs of segments that may intersect, including
+    every pair that does. Short segments, the usual case, are paired
+    through a grid of their bounding boxes; when the boxes overlap too much
+    for that (long spikes, as in star-shaped rings) a sweep is used
+    instead, so the cost follows the number of real intersections.
+    """
+    pairs = _grid_pairs(starts, ends, max_pairs=16 * len(starts) + 1024)
+    if pairs is None:
+        pairs = _sweep_pairs(starts, ends)
+    return pairs
+
+
+def find_crossings(starts, ends):
+    """
+    Return all (i, j), i < j, pairs of segments that intersect.
+
+    Candidate pairs come from _candidate_pairs and are tested exactly in
+    one batched call, so the cost is close to O((n + k) log n).
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    candidates = _candidate_pairs(starts, ends)
+    if not len(candidates):
+        return []
+
+    candidates = candidates[np.lexsort((candidates[:, 1], candidates[:, 0]))]
+    first, second = candidates[:, 0], candidates[:, 1]
+    crossing = segments_intersect_batch(starts[first], ends[first],
+                                        starts[second], ends[second])
+    return [tuple(pair) for pair in candidates[crossing].tolist()]
+
+
+def ring_crossings(coords, closed=True):
+    """Return the crossing edge pairs of a ring (or an open chain)."""
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if closed:
+        ends = np.roll(coords, -1, axis=0)
+        return find_crossings(coords, ends)
+    return find_crossings(coords[:-1], coords[1:])
+
+
+def repeated_vertices(coords):
+    """
+    Number of vertices of a ring that repeat an earlier one. A ring that
+    passes through a vertex twice is pinched there, which ring_crossings
+    does not report since the edges only share endpoints.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return len(coords) - len(np.unique(coords, axis=0))
+
+
+def _orientations_near(p, q, r, tolerance):
+    """orientations, with r within tolerance of the line p-q as collinear."""
+    val = ((q[:, 1] - p[:, 1]) * (r[:, 0] - q[:, 0]) -
+           (q[:, 0] - p[:, 0]) * (r[:, 1] - q[:, 1]))
+    val[np.abs(val) <= tolerance * np.hypot(*(q - p).T)] = 0
+    return np.sign(val).astype(np.int8)
+
+
+def rings_overlap(a, b):
+    """
+    Whether the areas of two rings overlap, without a polygon operation.
+    Edges crossing properly mean they do. Otherwise the boundaries at most
+    touch, and the areas overlap only if the inner side of some piece of
+    an edge (between the points where the rings touch) lies inside the
+    other ring. Rings that only share a boundary do not overlap. Only the
+    edges reaching into the overlap of the two bounding boxes are looked
+    at, so rings that barely meet are cheap to test.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    if len(a) < 3 or len(b) < 3:
+        return False
+    low = np.maximum(a.min(axis=0), b.min(axis=0))
+    high = np.minimum(a.max(axis=0), b.max(axis=0))
+    if (low >= high).any():
+        return False
+    starts = np.vstack([a, b])
+    ends = np.vstack([a[1:], a[:1], b[1:], b[:1]])
+    near = np.flatnonzero((np.maximum(starts, ends) >= low).all(axis=1)
+                          & (np.minimum(starts, ends) <= high).all(axis=1))
+    near_a, near_b = near[near < len(a)], near[near >= len(a)]
+    if len(near_a) * len(near_b) <= 4096:
+        # Few edges: every pair of boxes is compared directly
+        low_a = np.minimum(starts[near_a], ends[near_a])
+        high_a = np.maximum(starts[near_a], ends[near_a])
+        low_b = np.minimum(starts[near_b], ends[near_b])
+        high_b = np.maximum(starts[near_b], ends[near_b])
+        i, j = np.nonzero(
+            (low_a[:, None, :] <= high_b[None, :, :]).all(axis=2)
+            & (low_b[None, :, :] <= high_a[:, None, :]).all(axis=2))
+        pairs = np.column_stack([near_a[i], near_b[j]])
+    else:
+        pairs = near[_candidate_pairs(starts[near], ends[near])]
+        pairs = pairs[(pairs[:, 0] < len(a)) & (pairs[:, 1] >= len(a))]
+    # Points where the rings touch, as edge index and point
+    cut_edges = np.zeros(0, dtype=np.intp)
+    cut_points = np.zeros((0, 2))
+    if len(pairs):
+        i, j = pairs[:, 0], pairs[:, 1]
+        p1, p2, q1, q2 = starts[i], ends[i], starts[j], ends[j]
+        # Vertices made by earlier cuts lie on the other ring only up to
+        # rounding, so points this close to a line count as on it
+        tolerance = 1e-9 * (1 + np.abs(starts).max())
+        o1 = _orientations_near(p1, p2, q1, tolerance)
+        o2 = _orientations_near(p1, p2, q2, tolerance)
+        o3 = _orientations_near(q1, q2, p1, tolerance)
+        o4 = _orientations_near(q1, q2, p2, tolerance)
+        if ((o1 * o2 < 0) & (o3 * o4 < 0)).any():
+            return True
+        on_1 = (o1 == 0) & _on_segments(p1, q1, p2)
+        on_2 = (o2 == 0) & _on_segments(p1, q2, p2)
+        on_3 = (o3 == 0) & _on_segments(q1, p1, q2)
+        on_4 = (o4 == 0) & _on_segments(q1, p2, q2)
+        cut_edges = np.concatenate([i[on_1], i[on_2], j[on_3], j[on_4]])
+        cut_points = np.vstack([q1[on_1], q2[on_2], p1[on_3], p2[on_4]])
+
+    # Edges of a and b cut into pieces at the touching points: the points
+    # of every cut edge, its ends included, are sorted along it
+    split = np.unique(cut_edges)
+    whole = near[~np.isin(near, split)]
+    edge = np.concatenate([split, split, cut_edges])
+    points = np.vstack([starts[split], ends[split], cut_points])
+    along = ((points - starts[edge]) * (ends[edge] - starts[edge])).sum(axis=1)
+    order = np.lexsort((along, edge))
+    edge, points = edge[order], points[order]
+    same = edge[:-1] == edge[1:]
+    owner = np.concatenate([whole, edge[:-1][same]])
+    piece_starts = np.vstack([starts[whole], points[:-1][same]])
+    direction = np.vstack([ends[whole], points[1:][same]]) - piece_starts
+    # The inner side is on the left of a counterclockwise ring; the sample
+    # is moved off the piece by a tiny fraction of its length
+    from_a = owner < len(a)
+    side = np.where(from_a, 1.0 if ring_area(a) > 0 else -1.0,
+                    1.0 if ring_area(b) > 0 else -1.0)[:, None]
+    samples = (piece_starts + direction / 2 + 1e-6 * side
+               * np.column_stack([-direction[:, 1], direction[:, 0]]))
+    inside = (((samples > low) & (samples < high)).all(axis=1)
+              & (direction != 0).any(axis=1))
+    # Few samples are left, so they are tested against every edge of the
+    # other ring directly instead of building a RingIndex
+    for samples_of, ring in ((samples[inside & from_a], slice(len(a), None)),
+                             (samples[inside & ~from_a], slice(len(a)))):
+        if len(samples_of) == 0:
+            continue
+        ax, ay = starts[ring, 0], starts[ring, 1]
+        bx, by = ends[ring, 0], ends[ring, 1]
+        px, py = samples_of[:, :1], samples_of[:, 1:]
+        spans = (ay > py) != (by > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = ax + (py - ay) * (bx - ax) / (by - ay)
+        if ((spans & (px < cross_x)).sum(axis=1) % 2 == 1).any():
+            return True
+    return False
+
+
+def close_pairs(a, b, distance):
+    """
+    (i, j) index arrays of the points a[i], b[j] at most distance apart.
+    Only points within distance of the other set's bounding box are
+    compared; when many are left, points of b are sorted by the cell of a
+    grid of that size and each point of a is only compared with the
+    points of the 3 x 3 cells around it.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    empty = np.zeros(0, dtype=np.intp)
+    if len(a) == 0 or len(b) == 0:
+        return empty, empty
+    index_a = np.flatnonzero(((a >= b.min(axis=0) - distance)
+                              & (a <= b.max(axis=0) + distance)).all(axis=1))
+    index_b = np.flatnonzero(((b >= a.min(axis=0) - distance)
+                              & (b <= a.max(axis=0) + distance)).all(axis=1))
+    if len(index_a) == 0 or len(index_b) == 0:
+        return empty, empty
+    a, b = a[index_a], b[index_b]
+    if len(a) * len(b) <= 4096:
+        i, j = np.nonzero(np.hypot(a[:, None, 0] - b[None, :, 0],
+                                   a[:, None, 1] - b[None, :, 1]) <= distance)
+        return index_a[i], index_b[j]
+    cell = distance if distance > 0 else 1.0
+    origin = np.minimum(a.min(axis=0), b.min(axis=0)) - cell
+    cells_a = np.floor((a - origin) / cell).astype(np.int64)
+    cells_b = np.floor((b - origin) / cell).astype(np.int64)
+    columns = int(max(cells_a[:, 1].max(), cells_b[:, 1].max())) + 2
+    keys_b = cells_b[:, 0] * columns + cells_b[:, 1]
+    order = np.argsort(keys_b, kind="stable")
+    keys_b = keys_b[order]
+    found_a, found_b = [], []
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            keys = (cells_a[:, 0] + di) * columns + cells_a[:, 1] + dj
+            first = np.searchsorted(keys_b, keys, side="left")
+            counts = np.searchsorted(keys_b, keys, side="right") - first
+            i = np.repeat(np.arange(len(a)), counts)
+            steps = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+            j = order[np.repeat(first, counts) + steps]
+            close = np.hypot(*(a[i] - b[j]).T) <= distance
+            found_a.append(i[close])
+            found_b.append(j[close])
+    return (index_a[np.concatenate(found_a)],
+            index_b[np.concatenate(found_b)])
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _unique_sorted(coords):
+    """Indices of distinct coordinates, sorted by x and then y."""
+    _, first_index = np.unique(coords, axis=0, return_index=True)
+    return first_index[np.lexsort((coords[first_index, 1],
+                                   coords[first_index, 0]))]
+
+
+def _monotone_chain(coords):
+    order = _unique_sorted(coords)
+    if len(order) < 3:
+        return order
+
+    # Akl-Toussaint: points strictly inside the quadrilateral of the
+    # extreme points can never be on the hull
+    x, y = coords[order, 0], coords[order, 1]
+    extremes = [np.argmin(x), np.argmin(x + y), np.argmin(y), np.argmax(x - y),
+                np.argmax(x), np.argmax(x + y), np.argmax(y), np.argmin(x - y)]
+    corners = coords[order[np.array(extremes)]]
+    corners = corners[np.unique(corners, axis=0, return_index=True)[1]]
+    if len(corners) >= 3:
+        corners = corners[_monotone_chain_indices(corners)]
+        inside = np.ones(len(order), dtype=bool)
+        for a, b in zip(corners, np.roll(corners, -1, axis=0)):
+            inside &= ((b[0] - a[0]) * (y - a[1]) -
+                       (b[1] - a[1]) * (x - a[0])) > 0
+        order = order[~inside]
+    return order[_monotone_chain_indices(coords[order])]
+
+
+def _monotone_chain_indices(sorted_coords):
+    """Andrew's monotone chain over coordinates already sorted by (x, y)."""
+    points = sorted_coords.tolist()
+    if len(points) < 3:
+        return np.arange(len(points))
+    lower = []
+    for i, point in enumerate(points):
+        while len(lower) >= 2 and _cross(points[lower[-2]], points[lower[-1]],
+                                         point) <= 0:
+            lower.pop()
+        lower.append(i)
+    upper = []
+    for i in range(len(points) - 1, -1, -1):
+        while len(upper) >= 2 and _cross(points[upper[-2]], points[upper[-1]],
+                                         points[i]) <= 0:
+            upper.pop()
+        upper.append(i)
+    return np.array(lower[:-1] + upper[:-1], dtype=np.intp)
+
+
+def _gift_wrapping(coords):
+    order = _unique_sorted(coords)
+    if len(order) < 3:
+        return order
+    points = coords[order].tolist()
+    hull = []
+    p = 0
+    while True:
+        hull.append(p)
+        q = (p + 1) % len(points)
+        for i in range(len(points)):
+            if i == p:
+                continue
+            turn = _cross(points[p], points[q], points[i])
+            # On collinear candidates take the farthest one, so points lying
+            # on a hull edge are skipped instead of looping between them
+            if turn < 0 or (turn == 0 and _distance2(points[p], points[i]) >
+                            _distance2(points[p], points[q])):
+                q = i
+        p = q
+        if p == hull[0] or len(hull) > len(points):
+            break
+    return order[np.array(hull, dtype=np.intp)]
+
+
+def _distance2(a, b):
+    return (a[0] - b[0])**2 + (a[1] - b[1])**2
+
+
+HULL_METHODS = {
+    "monotone": _monotone_chain,
+    "jarvis": _gift_wrapping,
+}
+
+
+def convex_hull(coords, method="monotone"):
+    """
+    Return indices of the convex hull vertices of (N, 2) coordinates in
+    counterclockwise order, starting from the leftmost (then lowest) point.
+
+    Duplicates and points lying on hull edges are skipped, so collinear
+    input yields its two endpoints. method selects the backend from
+    HULL_METHODS; Andrew's monotone chain is O(n log n), gift wrapping
+    (Jarvis march) is O(n h).
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return HULL_METHODS[method](coords)
+
+
+def simplify_polyline(coords, tolerance):
+    """Douglas-Peucker simplification of an open (N, 2) polyline."""
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) < 3:
+        return coords
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = coords[end] - coords[start]
+        offsets = coords[start + 1:end] - coords[start]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] -
+                               segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return coords[keep]
+
+
+def simplify_ring(coords, tolerance):
+    """
+    Douglas-Peucker simplification of a closed ring. The ring is split at
+    its first vertex and the vertex farthest from it, so both are kept.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) < 4 or tolerance <= 0:
+        return coords
+    offsets = coords - coords[0]
+    far = int(np.argmax(np.hypot(offsets[:, 0], offsets[:, 1])))
+    if far == 0:
+        return coords[:1]
+    first = simplify_polyline(coords[:far + 1], tolerance)
+    second = simplify_polyline(np.vstack([coords[far:], coords[:1]]),
+                               tolerance)
+    return np.vstack([first, second[1:-1]])
+
+
+def ring_area(coords):
+    """Signed area of a ring, positive when it runs counterclockwise."""
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) < 3:
+        return 0.0
+    x, y = coords[:, 0], coords[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+class RingIndex:
+    """
+    Edges of a ring bucketed into horizontal strips, so a point-in-polygon
+    test only looks at the edges of the strip the point falls in - about
+    sqrt(n) of them instead of all n.
+    """
+
+    def __init__(self, coords, strips=None):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        self.starts = coords
+        self.ends = np.roll(coords, -1, axis=0)
+        n = len(coords)
+        self.strips = strips or max(1, int(np.sqrt(n)))
+        self.min_y = coords[:, 1].min() if n else 0.0
+        height = (coords[:, 1].max() - self.min_y) if n else 0.0
+        self.height = height / self.strips if height > 0 else 1.0
+
+        low = np.minimum(self.starts[:, 1], self.ends[:, 1])
+        high = np.maximum(self.starts[:, 1], self.ends[:, 1])
+        first = self._strip_of(low)
+        counts = self._strip_of(high) - first + 1
+        edge_ids = np.repeat(np.arange(n), counts)
+        steps = np.arange(len(edge_ids)) - np.repeat(np.cumsum(counts) - counts,
+                                                     counts)
+        strip_ids = first[edge_ids] + steps
+        order = np.argsort(strip_ids, kind="stable")
+        self.edge_ids = edge_ids[order]
+        self.bounds = np.searchsorted(strip_ids[order],
+                                      np.arange(self.strips + 1))
+
+    def _strip_of(self, y):
+        strip = np.floor((np.asarray(y) - self.min_y) / self.height)
+        return np.clip(strip, 0, self.strips - 1).astype(np.intp)
+
+    def contains(self, points):
+        """Boolean mask of the points strictly inside the ring (even-odd rule)."""
+        points = _as_points(points)
+        inside = np.zeros(len(points), dtype=bool)
+        if len(self.starts) < 3 or len(points) == 0:
+            return inside
+        strips = self._strip_of(points[:, 1])
+        for strip in np.unique(strips).tolist():
+            selected = np.flatnonzero(strips == strip)
+            edges = self.edge_ids[self.bounds[strip]:self.bounds[strip + 1]]
+            if len(edges) == 0:
+                continue
+            px = points[selected, 0][:, None]
+            py = points[selected, 1][:, None]
+            ax, ay = self.starts[edges, 0], self.starts[edges, 1]
+            bx, by = self.ends[edges, 0], self.ends[edges, 1]
+            spans = (ay > py) != (by > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cross_x = ax + (py - ay) * (bx - ax) / (by - ay)
+            crossings = (spans & (px < cross_x)).sum(axis=1)
+            inside[selected] = crossings % 2 == 1
+        return inside
+
+
+def _clean_ring(coords):
+    """
+    Ring without repeated consecutive vertices and without spikes (a
+    vertex whose edges run back along each other), counterclockwise.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) > 1:
+        keep = (coords != np.roll(coords, 1, axis=0)).any(axis=1)
+        coords = coords[keep]
+    tolerance = 1e-9 * (1 + np.abs(coords).max()) if len(coords) else 0.0
+    while len(coords) > 3:
+        previous = np.roll(coords, 1, axis=0)
+        following = np.roll(coords, -1, axis=0)
+        spike = ((_orientations_near(previous, coords, following,
+                                     tolerance) == 0)
+                 & (((coords - previous) * (following - coords)).sum(axis=1)
+                    < 0))
+        if not spike.any():
+            break
+        # Neighbouring spikes are removed one at a time, the second may
+        # not be one any more
+        spike &= ~np.roll(spike, 1)
+        coords = coords[~spike]
+        keep = (coords != np.roll(coords, 1, axis=0)).any(axis=1)
+        coords = coords[keep]
+    if ring_area(coords) < 0:
+        coords = coords[::-1]
+    return coords
+
+
+def _split_edges(a, b):
+    """
+    Cut every edge of rings a and b at the points where it meets the other
+    ring. Returns the pieces of each ring as lists of (start, end) tuples.
+    """
+    starts = np.vstack([a, b])
+    ends = np.vstack([np.roll(a, -1, axis=0), np.roll(b, -1, axis=0)])
+    pairs = _candidate_pairs(starts, ends)
+    pairs = pairs[(pairs[:, 0] < len(a)) & (pairs[:, 1] >= len(a))]
+    cuts = {}
+    if len(pairs):
+        i, j = pairs[:, 0], pairs[:, 1]
+        p1, p2, q1, q2 = starts[i], ends[i], starts[j], ends[j]
+        # Vertices within rounding error of the other edge's line count as
+        # on it: cut points from earlier operations are rarely exact, and
+        # an edge running along another one would otherwise be classified
+        # as neither shared nor crossing
+        tolerance = 1e-9 * (1 + np.abs(starts).max())
+        o1 = _orientations_near(p1, p2, q1, tolerance)
+        o2 = _orientations_near(p1, p2, q2, tolerance)
+        o3 = _orientations_near(q1, q2, p1, tolerance)
+        o4 = _orientations_near(q1, q2, p2, tolerance)
+        collinear = (o1 == 0) & (o2 == 0)
+        crossing = ~collinear & (o1 * o2 <= 0) & (o3 * o4 <= 0)
+        # A vertex lying on the other edge is used as is, so shared and
+        # touching vertices keep their exact coordinates
+        points = intersection_points(p1, p2, q1, q2)
+        # Computed points within rounding error of a vertex are snapped to
+        # it too, or the rings would get slivers one ulp long
+        for on_line, exact in ((o2 == 0, q2), (o1 == 0, q1),
+                               (o4 == 0, p2), (o3 == 0, p1)):
+            near = np.hypot(*(points - exact).T) <= tolerance
+            points[on_line | near] = exact[on_line | near]
+        for k in np.flatnonzero(crossing).tolist():
+            point = tuple(points[k].tolist())
+            cuts.setdefault(int(i[k]), []).append(point)
+            cuts.setdefault(int(j[k]), []).append(point)
+        # Collinear edges are cut at the endpoints lying on the other one
+        for edge, other_start, other_end, ends_on in (
+                (i, q1, q2, (_on_segments(p1, q1, p2), _on_segments(p1, q2, p2))),
+                (j, p1, p2, (_on_segments(q1, p1, q2), _on_segments(q1, p2, q2)))):
+            for point_set, on_edge in zip((other_start, other_end), ends_on):
+                for k in np.flatnonzero(collinear & on_edge).tolist():
+                    cuts.setdefault(int(edge[k]), []).append(
+                        tuple(point_set[k].tolist()))
+
+    pieces = ([], [])
+    for edge in range(len(starts)):
+        start = tuple(starts[edge].tolist())
+        end = tuple(ends[edge].tolist())
+        points = [start] + cuts.get(edge, []) + [end]
+        if edge in cuts:
+            direction = (end[0] - start[0], end[1] - start[1])
+            points.sort(key=lambda point: (point[0] - start[0]) * direction[0]
+                        + (point[1] - start[1]) * direction[1])
+        owner = pieces[0] if edge < len(a) else pieces[1]
+        for first, second in zip(points, points[1:]):
+            if first != second:
+                owner.append((first, second))
+    return pieces
+
+
+def _split_pinched(ring):
+    """
+    Split a closed walk at every vertex it passes twice, so rings that
+    only touch at a vertex come out as separate simple rings.
+    """
+    stack = []
+    position = {}
+    loops = []
+    for vertex in ring:
+        start = position.get(vertex)
+        if start is None:
+            position[vertex] = len(stack)
+            stack.append(vertex)
+            continue
+        loops.append(stack[start:])
+        for other in stack[start + 1:]:
+            del position[other]
+        del stack[start + 1:]
+    loops.append(stack)
+    return loops
+
+
+def _link_rings(edges):
+    """
+    Join directed edges into closed rings. Where a vertex has several
+    outgoing edges the walk turns as far right as possible; walks that
+    pass a vertex twice are split there by _split_pinched.
+    """
+    outgoing = {}
+    for index, (start, _) in enumerate(edges):
+        outgoing.setdefault(start, []).append(index)
+    used = [False] * len(edges)
+    rings = []
+    for first in range(len(edges)):
+        if used[first]:
+            continue
+        ring = []
+        index = first
+        while index is not None:
+            used[index] = True
+            start, end = edges[index]
+            ring.append(start)
+            options = [k for k in outgoing.get(end, ()) if not used[k]]
+            if not options:
+                index = None
+            elif len(options) == 1:
+                index = options[0]
+            else:
+                dx, dy = end[0] - start[0], end[1] - start[1]
+
+                def turn(k):
+                    ex = edges[k][1][0] - end[0]
+                    ey = edges[k][1][1] - end[1]
+                    return math.atan2(dx * ey - dy * ex, dx * ex + dy * ey)
+                index = min(options, key=turn)
+        # A walk that does not end where it started comes from numerical
+        # noise in the cuts and is dropped
+        if len(ring) >= 3 and end == ring[0]:
+            rings.extend(np.array(loop) for loop in _split_pinched(ring)
+                         if len(loop) >= 3)
+    return rings
+
+
+def _polygon_boolean(a, b, operation):
+    a, b = _clean_ring(a), _clean_ring(b)
+    if ring_area(a) == 0:
+        return [b] if operation == "union" and ring_area(b) != 0 else []
+    if ring_area(b) == 0:
+        return [] if operation == "intersection" else [a]
+    pieces_a, pieces_b = _split_edges(a, b)
+    keys_a, keys_b = set(pieces_a), set(pieces_b)
+
+    def midpoints(pieces):
+        return np.array([((s[0] + e[0]) / 2, (s[1] + e[1]) / 2)
+                         for s, e in pieces]).reshape(-1, 2)
+
+    in_b = RingIndex(b).contains(midpoints(pieces_a))
+    in_a = RingIndex(a).contains(midpoints(pieces_b))
+    edges = []
+    for (start, end), inside in zip(pieces_a, in_b.tolist()):
+        if (start, end) in keys_b:
+            # Boundary shared with b in the same direction
+            if operation != "difference":
+                edges.append((start, end))
+        elif (end, start) in keys_b:
+            # Shared in the opposite direction: the rings lie on both sides
+            if operation == "difference":
+                edges.append((start, end))
+        elif inside == (operation == "intersection"):
+            edges.append((start, end))
+    for (start, end), inside in zip(pieces_b, in_a.tolist()):
+        if (start, end) in keys_a or (end, start) in keys_a:
+            continue
+        if operation == "union" and not inside:
+            edges.append((start, end))
+        elif operation == "intersection" and inside:
+            edges.append((start, end))
+        elif operation == "difference" and inside:
+            edges.append((end, start))
+    return _link_rings(edges)
+
+
+def polygon_union(a, b):
+    """
+    Union of two simple polygon rings as a list of rings: counterclockwise
+    outlines and clockwise holes.
+
+    Edges of each ring are cut where they meet the other ring (candidate
+    pairs come from the bounding-box sweep), every piece is classified as
+    inside, outside or on the other ring's boundary with a RingIndex, and
+    the kept pieces are linked back into rings. Shared and touching
+    vertices keep their exact coordinates.
+    """
+    return _polygon_boolean(a, b, "union")
+
+
+def polygon_difference(a, b):
+    """Ring a minus ring b as a list of rings, see polygon_union."""
+    return _polygon_boolean(a, b, "difference")
+
+
+def polygon_intersection(a, b):
+    """The part of ring a inside ring b as a list of rings, see polygon_union."""
+    return _polygon_boolean(a, b, "intersection")
+
+
+def cut_holes(outline, holes):
+    """
+    A simple ring covering outline without the holes inside it, and the
+    area of outline outside the holes that it no longer covers. Each hole
+    is opened to the outside through a narrow slot running from its top,
+    bottom, left or right vertex, whichever keeps the most of the outline
+    in its largest piece, so a land cut around another one does not cover
+    it; the slot and the other pieces make up the lost area.
+    """
+    outline = _clean_ring(outline)
+    lost = 0.0
+    for hole in holes:
+        hole = _clean_ring(hole)
+        if (len(outline) < 3 or len(hole) < 3
+                or RingIndex(outline).contains(hole).mean() <= 0.5):
+            continue
+        extent = np.ptp(hole, axis=0).max()
+        width = extent / 100
+        remaining = ring_area(outline) - abs(ring_area(hole))
+        best, best_area = np.zeros((0, 2)), 0.0
+        for axis, end in ((1, 1), (1, -1), (0, 1), (0, -1)):
+            # The slot runs along axis from the hole's extreme vertex in
+            # direction end to past the outline
+            vertex = hole[np.argmax(end * hole[:, axis])]
+            far = (outline[:, axis].max() + extent if end > 0
+                   else outline[:, axis].min() - extent)
+            slot = np.array([(vertex[axis] - end * width, -width),
+                             (vertex[axis] - end * width, width),
+                             (far, width), (far, -width)])
+            slot[:, 1] += vertex[1 - axis]
+            if axis == 1:
+                slot = np.ascontiguousarray(slot[:, ::-1])
+            cut = [ring for ring in polygon_union(hole, slot)
+                   if ring_area(ring) > 0]
+            for piece in polygon_difference(outline, max(cut, key=ring_area)):
+                area = ring_area(piece)
+                if area > best_area:
+                    best, best_area = piece, area
+            if best_area >= remaining - width * extent:
+                break
+        outline = best
+        lost += max(remaining - best_area, 0.0)
+    return outline, lost
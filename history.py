@@ -0,0 +1,160 @@
+from collections import deque
+
+# Rough size of a Point object kept alive by the journal
+POINT_BYTES = 64
+
+
+class Edit:
+    """Lands and free points changed by a single click or batch of clicks."""
+
+    def __init__(self, lands_to_modify):
+        self.added_lands = []
+        self.removed_lands = []
+        # land -> ((coords, color_id) before, (coords, color_id) after)
+        self.modified_lands = {
+            land: ((land.coords, land.color_id), None)
+            for land in lands_to_modify
+        }
+        self.removed_points = []
+        self.size = 0
+
+    def finish(self):
+        """Store the after-state of modified lands and drop unchanged ones."""
+        for land, (before, _) in list(self.modified_lands.items()):
+            after = (land.coords, land.color_id)
+            if after[0] is before[0] and after[1] == before[1]:
+                del self.modified_lands[land]
+            else:
+                self.modified_lands[land] = (before, after)
+
+    def is_empty(self):
+        return not (self.added_lands or self.removed_lands
+                    or self.modified_lands or self.removed_points)
+
+    def nbytes(self):
+        # Added lands are still on the map, so only the arrays and points that
+        # the journal alone may be keeping alive are counted
+        size = POINT_BYTES * len(self.removed_points)
+        for land, coords in self.removed_lands:
+            size += coords.nbytes
+        for before, after in self.modified_lands.values():
+            size += before[0].nbytes + after[0].nbytes
+        return size
+
+    def revert(self, editor):
+        for land, coords in reversed(self.removed_lands):
+            land.coords = coords
+            editor.add_land(land)
+        for land, (before, _) in self.modified_lands.items():
+            land.coords, land.color_id = before
+            if land in editor.indexed_vertices:
+                editor.reindex_land(land)
+        editor.remove_lands(self.added_lands)
+        editor.points.extend(self.removed_points)
+
+    def apply(self, editor):
+        for land, (_, after) in self.modified_lands.items():
+            land.coords, land.color_id = after
+            if land in editor.indexed_vertices:
+                editor.reindex_land(land)
+        editor.remove_lands([land for land, _ in self.removed_lands])
+        for land in self.added_lands:
+            editor.add_land(land)
+        for point in self.removed_points:
+            editor.points.discard(point)
+
+
+class EditJournal:
+    """
+    Undo/redo history that keeps only what each click changed.
+
+    Land coordinate arrays are never changed in place, only replaced, so an
+    edit can keep references to the old arrays instead of copying them.
+    The oldest edits are dropped once the journal uses more than
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size_bytes = 0
+        self.current = None
+
+    def begin(self, lands_to_modify=()):
+        self.current = Edit(lands_to_modify)
+        return self.current
+
+    def touch(self, lands):
+        """
+        Add lands to the open edit before they change, for edits that find
+        the lands they touch as they go (MapEngine.apply_clicks).
+        """
+        edit = self.current
+        if edit is None:
+            return
+        for land in lands:
+            if land not in edit.modified_lands and \
+                    land not in edit.added_lands:
+                edit.modified_lands[land] = ((land.coords, land.color_id),
+                                             None)
+
+    def land_added(self, land):
+        if self.current is not None:
+            self.current.added_lands.append(land)
+
+    def land_removed(self, land):
+        if self.current is None:
+            return
+        if land in self.current.added_lands:
+            self.current.added_lands.remove(land)
+        else:
+            self.current.removed_lands.append((land, land.coords))
+
+    def point_removed(self, point):
+        if self.current is not None:
+            self.current.removed_points.append(point)
+
+    def commit(self):
+        """Close the current edit and return it, or None if nothing changed."""
+        edit, self.current = self.current, None
+        if edit is None:
+            return None
+        edit.finish()
+        if edit.is_empty():
+            return None
+        edit.size = edit.nbytes()
+        self.undo_stack.append(edit)
+        self.size_bytes += edit.size
+        for undone in self.redo_stack:
+            self.size_bytes -= undone.size
+        self.redo_stack = []
+        while len(self.undo_stack) > 1 and self.size_bytes > self.max_bytes:
+            self.size_bytes -= self.undo_stack.popleft().size
+        return edit
+
+    def rollback(self, editor):
+        """
+        Revert and drop the open edit, for a click that failed halfway, so
+        the map is back to its state before begin().
+        """
+        edit, self.current = self.current, None
+        if edit is not None:
+            edit.revert(editor)
+        return edit
+
+    def undo(self, editor):
+        if not self.undo_stack:
+            return None
+        edit = self.undo_stack.pop()
+        edit.revert(editor)
+        self.redo_stack.append(edit)
+        return edit
+
+    def redo(self, editor):
+        if not self.redo_stack:
+            return None
+        edit = self.redo_stack.pop()
+        edit.apply(editor)
+        self.undo_stack.append(edit)
+        return edit
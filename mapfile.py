@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# Binary layout, all little-endian:
+#   magic, uint32 version, uint32 header length, JSON header padded to 8 bytes,
+#   int64 offsets[lands + 1], float64 coords[vertices, 2], uint8 color ids[lands]
+# and since version 2, after padding to 8 bytes, the tile directory:
+#   float64 land boxes[lands, 4], int64 tile keys[tiles, 2],
+#   int64 tile lands[tiles + 1], float64 tile boxes[tiles, 4]
+# Land k owns coords[offsets[k]:offsets[k + 1]], so every section can be
+# memory-mapped as it is. Lands are stored tile by tile, tile t owning lands
+# tile_lands[t]:tile_lands[t + 1], so the lands of a window are a few
+# contiguous byte ranges. Boxes are (min_x, min_y, max_x, max_y).
+MAGIC = b"PMAP"
+FORMAT_VERSION = 2
+DEFAULT_TILE_SIZE = 1000.0
+FORMATS = ("binary", "jsonl", "json")
+EXTENSIONS = {".pmap": "binary", ".jsonl": "jsonl"}
+
+
+def land_rings(lands):
+    """(coords, color) pairs of engine lands, reading lands or such pairs."""
+    for land in lands:
+        if isinstance(land, tuple):
+            yield land
+        elif hasattr(land, "coords"):
+            yield land.coords, land.color
+        else:
+            yield [(point.x, point.y) for point in land.points], land.color
+
+
+def format_of(filename):
+    """Format an output file gets from its extension; anything else is json."""
+    return EXTENSIONS.get(os.path.splitext(filename)[1].lower(), "json")
+
+
+def detect_format(filename):
+    """Format of an existing file, read from its first bytes."""
+    with open(filename, "rb") as file:
+        start = file.read(64)
+    if start.startswith(MAGIC):
+        return "binary"
+    if start.lstrip().startswith(b"{"):
+        return "jsonl"
+    return "json"
+
+
+def ring_boxes(coords, offsets):
+    """Bounding boxes of the rings coords[offsets[k]:offsets[k + 1]]."""
+    if len(offsets) < 2:
+        return np.zeros((0, 4))
+    starts = offsets[:-1]
+    return np.column_stack([np.minimum.reduceat(coords, starts),
+                            np.maximum.reduceat(coords, starts)])
+
+
+def write_binary(rings, filename, tile_size=DEFAULT_TILE_SIZE):
+    colors = []
+    color_ids = []
+    coords = []
+    for ring, color in rings:
+        ring = np.asarray(ring, dtype="<f8").reshape(-1, 2)
+        if len(ring) == 0:
+            continue
+        if color not in colors:
+            colors.append(color)
+        color_ids.append(colors.index(color))
+        coords.append(ring)
+    color_ids = np.array(color_ids, dtype="u1")
+
+    lengths = np.array([len(ring) for ring in coords], dtype="<i8")
+    starts = np.concatenate([[0], np.cumsum(lengths)])
+    all_coords = np.concatenate(coords) if coords else np.zeros((0, 2))
+    boxes = ring_boxes(all_coords, starts)
+    first_vertices = all_coords[starts[:-1]]
+    # A land belongs to the tile of its first vertex; a stable sort keeps
+    # the save order inside a tile
+    keys = np.floor(first_vertices / tile_size).astype("<i8")
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    keys, boxes, lengths = keys[order], boxes[order], lengths[order]
+    color_ids = color_ids[order]
+    offsets = np.zeros(len(coords) + 1, dtype="<i8")
+    np.cumsum(lengths, out=offsets[1:])
+
+    new_tile = np.ones(len(keys), dtype=bool)
+    new_tile[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+    tile_starts = np.flatnonzero(new_tile)
+    tile_keys = keys[tile_starts]
+    tile_lands = np.append(tile_starts, len(keys)).astype("<i8")
+    if len(tile_starts):
+        tile_boxes = np.column_stack([
+            np.minimum.reduceat(boxes[:, :2], tile_starts),
+            np.maximum.reduceat(boxes[:, 2:], tile_starts)])
+    else:
+        tile_boxes = np.zeros((0, 4))
+
+    header = json.dumps({"lands": len(coords), "vertices": int(offsets[-1]),
+                         "colors": colors, "tiles": len(tile_keys),
+                         "tile_size": tile_size}).encode()
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+
+    with open(filename, "wb") as file:
+        file.write(MAGIC)
+        file.write(np.array([FORMAT_VERSION, len(header)], dtype="<u4"))
+        file.write(header)
+        file.write(offsets)
+        for index in order:
+            file.write(coords[index])
+        file.write(color_ids)
+        file.write(b"\0" * (-len(color_ids) % 8))
+        file.write(boxes.astype("<f8"))
+        file.write(tile_keys)
+        file.write(tile_lands)
+        file.write(tile_boxes.astype("<f8"))
+
+
+def write_jsonl(rings, filename):
+    with open(filename, "w") as file:
+        file.write(json.dumps({"format": "point-map",
+                               "version": FORMAT_VERSION}) + "\n")
+        for ring, color in rings:
+            file.write(json.dumps({"color": color,
+                                   "points": np.asarray(ring).tolist()}) + "\n")
+
+
+def write_json(rings, filename):
+    """The original lands_data.txt format: one JSON list of lands."""
+    land_data = [{"color": color, "points": np.asarray(ring).tolist()}
+                 for ring, color in rings]
+    # json.dumps is much faster than json.dump, which writes many small chunks
+    with open(filename, "w") as file:
+        file.write(json.dumps(land_data))
+
+
+WRITERS = {"binary": write_binary, "jsonl": write_jsonl, "json": write_json}
+
+
+def save_map(lands, filename, format=None, **options):
+    """
+    Writes lands (see land_rings) to filename. Without format it is taken
+    from the extension: .pmap is binary, .jsonl is JSON lines and anything
+    else the original JSON list. options go to the writer, e.g. tile_size
+    of the binary tile directory.
+    """
+    WRITERS[format or format_of(filename)](land_rings(lands), filename,
+                                           **options)
+
+
+class BinaryMap:
+    """
+    A binary map file opened with np.memmap. Nothing is read until a land
+    is asked for, and then only that land's coordinates. query_box uses the
+    tile directory to touch only the parts of the file near a window.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            magic = file.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{filename} is not a binary map file")
+            self.version, header_length = np.fromfile(file, dtype="<u4",
+                                                      count=2)
+            if self.version > FORMAT_VERSION:
+                raise ValueError(f"{filename} has format version "
+                                 f"{self.version}, newer than "
+                                 f"{FORMAT_VERSION}")
+            header = json.loads(file.read(int(header_length)))
+        self.colors = header["colors"]
+        land_count, vertex_count = header["lands"], header["vertices"]
+
+        start = len(MAGIC) + 8 + int(header_length)
+        self.offsets = self._section("<i8", start, (land_count + 1,))
+        start += self.offsets.nbytes
+        self.coords = self._section("<f8", start, (vertex_count, 2))
+        start += self.coords.nbytes
+        self.color_ids = self._section("u1", start, (land_count,))
+        start += land_count + (-land_count % 8)
+
+        if self.version < 2:
+            # Files without a tile directory are one tile holding every land
+            self.tile_size = None
+            self.land_boxes = None
+            self.tile_keys = np.zeros((1, 2), dtype=int)
+            self.tile_lands = np.array([0, land_count])
+            self.tile_boxes = np.array([[-np.inf, -np.inf, np.inf, np.inf]])
+            return
+        tile_count = header["tiles"]
+        self.tile_size = header["tile_size"]
+        self.land_boxes = self._section("<f8", start, (land_count, 4))
+        start += self.land_boxes.nbytes
+        self.tile_keys = self._section("<i8", start, (tile_count, 2))
+        start += self.tile_keys.nbytes
+        self.tile_lands = self._section("<i8", start, (tile_count + 1,))
+        start += self.tile_lands.nbytes
+        self.tile_boxes = self._section("<f8", start, (tile_count, 4))
+
+    def _section(self, dtype, offset, shape):
+        # np.memmap refuses empty arrays
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode="r", offset=offset,
+                         shape=shape)
+
+    def boxes(self, indices):
+        """Bounding boxes of the given lands."""
+        indices = np.asarray(indices, dtype=int)
+        if self.land_boxes is not None:
+            return np.asarray(self.land_boxes[indices])
+        return np.array([(coords[:, 0].min(), coords[:, 1].min(),
+                          coords[:, 0].max(), coords[:, 1].max())
+                         for coords in (self[index][0] for index in indices)
+                         ]).reshape(-1, 4)
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """Indices of the lands whose bounding box overlaps the window."""
+        tiles = np.asarray(self.tile_boxes)
+        hit = np.flatnonzero((tiles[:, 0] <= max_x) & (min_x <= tiles[:, 2])
+                             & (tiles[:, 1] <= max_y) & (min_y <= tiles[:, 3]))
+        if len(hit) == 0:
+            return np.zeros(0, dtype=int)
+        candidates = np.concatenate([np.arange(self.tile_lands[tile],
+                                               self.tile_lands[tile + 1])
+                                     for tile in hit])
+        boxes = self.boxes(candidates)
+        inside = ((boxes[:, 0] <= max_x) & (min_x <= boxes[:, 2])
+                  & (boxes[:, 1] <= max_y) & (min_y <= boxes[:, 3]))
+        return candidates[inside]
+
+    def window(self, min_x, min_y, max_x, max_y):
+        """(index, coords, color) of every land overlapping the window."""
+        for index in self.query_box(min_x, min_y, max_x, max_y):
+            coords, color = self[index]
+            yield index, coords, color
+
+    def __len__(self):
+        return len(self.color_ids)
+
+    def __getitem__(self, index):
+        """(coords, color) of land index, coords still backed by the file."""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.coords[start:end], self.colors[self.color_ids[index]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def iter_jsonl(filename):
+    with open(filename) as file:
+        header = json.loads(file.readline())
+        if header.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"{filename} has format version "
+                             f"{header['version']}, newer than "
+                             f"{FORMAT_VERSION}")
+        for line in file:
+            if line.strip():
+                land_dict = json.loads(line)
+                yield np.array(land_dict["points"], dtype=float).reshape(-1, 2), \
+                    land_dict["color"]
+
+
+def iter_json(filename):
+    # The original format is a single JSON document, so it is parsed whole
+    with open(filename) as file:
+        land_data = json.load(file)
+    for land_dict in land_data:
+        yield np.array(land_dict["points"], dtype=float).reshape(-1, 2), \
+            land_dict["color"]
+
+
+def open_map(filename):
+    """
+    Lands of a map file in any format as (coords, color) pairs. Binary
+    files give a BinaryMap, the others a generator reading them as it goes.
+    """
+    format = detect_format(filename)
+    if format == "binary":
+        return BinaryMap(filename)
+    if format == "jsonl":
+        return iter_jsonl(filename)
+    return iter_json(filename)
+
+
+def convert(source, target, format=None):
+    save_map(open_map(source), target, format)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert map files, e.g. lands_data.txt to lands.pmap")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="output format (default: from the extension)")
+    args = parser.parse_args()
+    convert(args.source, args.target, args.format)
+    print(f"{args.source} ({detect_format(args.source)}) -> {args.target} "
+          f"({detect_format(args.target)})")
+
+
+if __name__ == "__main__":
+    main()
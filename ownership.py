@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+from geometry import RingIndex
+from spatial import BoxGrid
+
+
+class LandIndex:
+    """
+    Answers which land owns a location: land bounding boxes in a BoxGrid
+    and, for the lands whose box holds a point, a ray-casting
+    point-in-polygon test over the land's coordinate array.
+
+    Lands are any hashable keys with a coords array (or coords passed to
+    add), so the same index serves MapEngine lands and the rings of a saved
+    map, see from_rings. A land's cached bbox is used when it has one.
+    Lands are not expected to overlap; where they do, the first land found
+    wins.
+    """
+
+    def __init__(self, cell_size=100):
+        self.boxes = BoxGrid(cell_size)
+        # land -> (coords, RingIndex built on first use)
+        self.rings = {}
+
+    @classmethod
+    def from_rings(cls, rings, cell_size=100):
+        """Index of (coords, color) pairs, e.g. mapfile.open_map, keyed by position."""
+        index = cls(cell_size)
+        for position, (coords, _) in enumerate(rings):
+            index.add(position, coords)
+        return index
+
+    def add(self, land, coords=None):
+        box = None
+        if coords is None:
+            coords = land.coords
+            box = getattr(land, "bbox", None)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if len(coords) < 3:
+            self.discard(land)
+            return
+        if box is None:
+            box = (coords[:, 0].min(), coords[:, 1].min(),
+                   coords[:, 0].max(), coords[:, 1].max())
+        self.boxes.add(land, box)
+        self.rings[land] = (coords, None)
+
+    def discard(self, land):
+        self.boxes.discard(land)
+        self.rings.pop(land, None)
+
+    def __contains__(self, land):
+        return land in self.rings
+
+    def __len__(self):
+        return len(self.rings)
+
+    def _ring_index(self, land):
+        coords, ring_index = self.rings[land]
+        if ring_index is None:
+            ring_index = RingIndex(coords)
+            self.rings[land] = (coords, ring_index)
+        return ring_index
+
+    def land_at(self, x, y):
+        """The land containing (x, y), or None."""
+        for land in self.boxes.query_box(x, y, x, y):
+            if self._ring_index(land).contains([(x, y)])[0]:
+                return land
+        return None
+
+    def lands_at(self, points):
+        """
+        Owner of every point of an (N, 2) array as a list of lands and
+        None. Points are bucketed by grid cell once, so each land only
+        tests the points in the cells under its box.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        owners = np.full(len(points), -1, dtype=np.intp)
+        if len(points) == 0 or not self.rings:
+            return [None] * len(points)
+
+        cell_size = self.boxes.cell_size
+        cells = np.floor(points / cell_size).astype(np.int64)
+        low = cells.min(axis=0)
+        row_count = int(cells[:, 0].max() - low[0]) + 1
+        row_length = int(cells[:, 1].max() - low[1]) + 1
+        keys = (cells[:, 0] - low[0]) * row_length + (cells[:, 1] - low[1])
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        lands = self.boxes.query_box(*points.min(axis=0), *points.max(axis=0))
+        for number, land in enumerate(lands):
+            min_x, min_y, max_x, max_y = self.boxes.boxes[land]
+            min_j = max(math.floor(min_y / cell_size) - low[1], 0)
+            max_j = min(math.floor(max_y / cell_size) - low[1], row_length - 1)
+            min_i = max(math.floor(min_x / cell_size) - low[0], 0)
+            max_i = min(math.floor(max_x / cell_size) - low[0], row_count - 1)
+            slices = []
+            for i in range(min_i, max_i + 1):
+                start, end = np.searchsorted(
+                    sorted_keys, [i * row_length + min_j,
+                                  i * row_length + max_j + 1])
+                if end > start:
+                    slices.append(order[start:end])
+            if not slices:
+                continue
+            candidates = np.concatenate(slices)
+            candidates = candidates[owners[candidates] < 0]
+            inside = self._ring_index(land).contains(points[candidates])
+            owners[candidates[inside]] = number
+        return [lands[owner] if owner >= 0 else None
+                for owner in owners.tolist()]
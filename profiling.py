@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullStage:
+    """Context manager used while profiling is off; does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    """
+    Per-stage timers and named counters for the click pipeline.
+
+    While disabled, stage() hands out one shared no-op context manager and
+    count() returns at once, so instrumented code pays a method call per
+    stage. Timings keep the last window samples of each stage for the
+    rolling summary; with trace=True every stage is also kept, up to
+    max_events, as a Chrome trace event (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, enabled=False, window=1000, trace=False,
+                 max_events=1000000):
+        self.enabled = enabled
+        self.window = window
+        self.trace = trace
+        self.max_events = max_events
+        # Stages are recorded by the edit worker while the window thread
+        # may be reading a report
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # name -> deque of the last window durations in seconds
+            self.samples = {}
+            # name -> [calls, total seconds] since the last reset
+            self.totals = {}
+            self.counters = {}
+            self.events = []
+            self.origin = time.perf_counter()
+
+    def enable(self, trace=None):
+        self.enabled = True
+        if trace is not None:
+            self.trace = trace
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name):
+        """Context manager timing one run of a stage."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, start, end):
+        with self.lock:
+            self._record(name, start, end)
+
+    def _record(self, name, start, end):
+        duration = end - start
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+            self.totals[name] = [0, 0.0]
+        samples.append(duration)
+        totals = self.totals[name]
+        totals[0] += 1
+        totals[1] += duration
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append({
+                "name": name, "ph": "X", "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "ts": (start - self.origin) * 1e6, "dur": duration * 1e6,
+            })
+
+    def summary(self):
+        """Stage statistics (rolling window and totals) and counters."""
+        with self.lock:
+            samples = {name: list(window)
+                       for name, window in self.samples.items()}
+            totals = {name: list(total) for name, total in self.totals.items()}
+            counters = dict(self.counters)
+        stages = {}
+        for name, window in samples.items():
+            ordered = sorted(window)
+            calls, total = totals[name]
+            stages[name] = {
+                "calls": calls,
+                "total_s": total,
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+                "p50_ms": 1000 * ordered[len(ordered) // 2],
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1,
+                                             int(len(ordered) * 0.95))],
+                "max_ms": 1000 * ordered[-1],
+            }
+        return {"stages": stages, "counters": counters}
+
+    def report(self):
+        """The summary as a text table, slowest stages first."""
+        summary = self.summary()
+        lines = [f"{'stage':<24} {'calls':>7} {'total s':>9} {'mean ms':>9} "
+                 f"{'p95 ms':>9} {'max ms':>9}"]
+        for name, stats in sorted(summary["stages"].items(),
+                                  key=lambda item: -item[1]["total_s"]):
+            lines.append(f"{name:<24} {stats['calls']:>7} "
+                         f"{stats['total_s']:>9.3f} {stats['mean_ms']:>9.3f} "
+                         f"{stats['p95_ms']:>9.3f} {stats['max_ms']:>9.3f}")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name:<24} {value:>7}")
+        return "\n".join(lines)
+
+    def export_json(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def export_chrome_trace(self, filename):
+        """Writes the recorded events in the Chrome trace event format."""
+        with open(filename, "w") as file:
+            with self.lock:
+                events = list(self.events)
+            json.dump({"traceEvents": events,
+                       "displayTimeUnit": "ms"}, file)
+
+
+# Profiler shared by the engine, the editor and the command line tools
+PROFILER = Profiler()
@@ -1,5 +1,11 @@
-import json
+import argparse
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from geometry import repeated_vertices, ring_crossings
+from mapfile import BinaryMap, detect_format, land_rings, open_map
+from rendering import MapRenderer
 
 class Point:
     def __init__(self, x, y, color):
@@ -19,34 +25,160 @@ class Land:
         self.points = points
         self.lines = [Line(points[i], points[(i + 1) % len(points)], color) for i in range(len(points))]
 
-def load_lands_from_file(filename):
+def iter_lands_from_file(filename):
     """
-    Odczytuje landy z pliku tekstowego i zwraca listę obiektów land.
+    Zwraca kolejne landy z pliku mapy w dowolnym formacie (patrz mapfile),
+    czytając plik na bieżąco zamiast całego naraz.
+    """
+    for coords, color in open_map(filename):
+        points = [Point(x, y, color) for x, y in coords.tolist()]
+        yield Land(points, color)
+
+def load_lands_from_file(filename, validate=False):
+    """
+    Odczytuje landy z pliku mapy i zwraca listę obiektów land.
+    Z validate=True wypisuje landy, których krawędzie się przecinają albo
+    które przechodzą przez ten sam wierzchołek dwa razy.
+    """
+    lands = list(iter_lands_from_file(filename))
+    if validate:
+        for index, land in enumerate(lands):
+            coords = [(point.x, point.y) for point in land.points]
+            crossings = ring_crossings(coords)
+            if crossings:
+                print(f"land {index} ({land.color}) has {len(crossings)} crossing edge pairs")
+            repeated = repeated_vertices(coords)
+            if repeated:
+                print(f"land {index} ({land.color}) has {repeated} repeated vertices")
+    return lands
+
+def load_lands_in_window(filename, min_x, min_y, max_x, max_y):
+    """
+    Wczytuje z binarnego pliku mapy tylko landy, których prostokąt
+    otaczający przecina okno - plik jest mapowany w pamięci, więc reszta
+    nie jest czytana z dysku.
     """
     lands = []
-    with open(filename, 'r') as file:
-        land_data = json.load(file)
-        for land_dict in land_data:
-            color = land_dict["color"]
-            points = [Point(x, y, color) for x, y in land_dict["points"]]
-            land = Land(points, color)
-            lands.append(land)
+    for _, coords, color in BinaryMap(filename).window(min_x, min_y,
+                                                       max_x, max_y):
+        points = [Point(x, y, color) for x, y in coords.tolist()]
+        lands.append(Land(points, color))
     return lands
 
-def display_lands(lands):
-    fig, ax = plt.subplots(figsize=(10, 10))
-    ax.set_xlim(0, 1000)
-    ax.set_ylim(0, 1000)
-    for land in lands:
-        for line in land.lines:
-            ax.plot([line.p1.x, line.p2.x], [line.p1.y, line.p2.y], color=line.color)
-        for point in land.points:
-            ax.plot(point.x, point.y, 'o', color=point.color)
+class PagedLand:
+    """Land wczytany z pliku tylko do rysowania - współrzędne i kolor."""
+    __slots__ = ("index", "coords", "color")
+
+    def __init__(self, index, coords, color):
+        self.index = index
+        self.coords = coords
+        self.color = color
+
+    @property
+    def bbox(self):
+        return (*self.coords.min(axis=0).tolist(),
+                *self.coords.max(axis=0).tolist())
+
+class MapViewer:
+    """
+    Przeglądarka binarnego pliku mapy. Trzyma w pamięci tylko landy w
+    widocznym oknie (powiększonym o margin jego szerokości) i doczytuje je
+    przy przesuwaniu i przybliżaniu widoku.
+    """
+
+    def __init__(self, filename, window=(0, 0, 1000, 1000), margin=0.5):
+        self.map_file = BinaryMap(filename)
+        self.margin = margin
+        # indeks landu w pliku -> PagedLand
+        self.loaded = {}
+        self.fig, self.ax = plt.subplots(figsize=(10, 10))
+        self.ax.set_aspect('equal')
+        self.ax.set_title('Mapa z wczytanymi landami')
+        self.renderer = MapRenderer(self.ax)
+        self.ax.set_xlim(window[0], window[2])
+        self.ax.set_ylim(window[1], window[3])
+        self.ax.callbacks.connect('xlim_changed', self.on_limits_changed)
+        self.ax.callbacks.connect('ylim_changed', self.on_limits_changed)
+        self.refresh()
+
+    def on_limits_changed(self, ax):
+        self.refresh()
+
+    def refresh(self):
+        min_x, max_x = self.ax.get_xlim()
+        min_y, max_y = self.ax.get_ylim()
+        margin_x = (max_x - min_x) * self.margin
+        margin_y = (max_y - min_y) * self.margin
+        wanted = self.map_file.query_box(min_x - margin_x, min_y - margin_y,
+                                         max_x + margin_x, max_y + margin_y)
+        loaded = {}
+        for index in wanted.tolist():
+            land = self.loaded.get(index)
+            if land is None:
+                coords, color = self.map_file[index]
+                land = PagedLand(index, coords, color)
+            loaded[index] = land
+        self.loaded = loaded
+        self.renderer.set_viewport(min_x, max_x, min_y, max_y)
+        self.renderer.sync(list(loaded.values()))
+        self.fig.canvas.draw_idle()
+
+def display_lands(lands, show_points=True, output=None,
+                  limits=(0, 1000, 0, 1000)):
+    """
+    Rysuje landy jednym LineCollection na wszystkie krawędzie i jednym
+    scatter na kolor punktów. show_points=False pomija punkty, a z output
+    obraz jest zapisywany do pliku (PNG, SVG, ...) bez otwierania okna.
+    limits=None dopasowuje widok do landów.
+    """
+    rings = []
+    edge_colors = []
+    points_by_color = {}
+    for coords, color in land_rings(lands):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if len(coords) == 0:
+            continue
+        rings.append(np.vstack([coords, coords[:1]]))
+        edge_colors.append(color)
+        if show_points:
+            points_by_color.setdefault(color, []).append(coords)
+
+    if output is None:
+        fig, ax = plt.subplots(figsize=(10, 10))
+    else:
+        # Figure bez pyplot nie potrzebuje okna ani interaktywnego backendu
+        fig = Figure(figsize=(10, 10))
+        ax = fig.add_subplot()
+    ax.add_collection(LineCollection(rings, colors=edge_colors))
+    for color, coords in points_by_color.items():
+        coords = np.concatenate(coords)
+        ax.scatter(coords[:, 0], coords[:, 1], color=color, marker='o')
+    if limits is None:
+        ax.autoscale_view()
+    else:
+        ax.set_xlim(limits[0], limits[1])
+        ax.set_ylim(limits[2], limits[3])
     ax.set_title('Mapa z wczytanymi landami')
     ax.set_aspect('equal')
-    plt.show()
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
+    return fig
 
 if __name__ == "__main__":
-    filename = "lands_data.txt"
-    loaded_lands = load_lands_from_file(filename)
-    display_lands(loaded_lands)
+    parser = argparse.ArgumentParser(description="Wyświetla zapisaną mapę")
+    parser.add_argument("filename", nargs="?", default="lands_data.txt")
+    parser.add_argument("--output", help="zapisz obraz do pliku zamiast okna")
+    parser.add_argument("--no-points", action="store_true",
+                        help="nie rysuj wierzchołków")
+    parser.add_argument("--fit", action="store_true",
+                        help="dopasuj widok do landów zamiast 0-1000")
+    args = parser.parse_args()
+    limits = None if args.fit else (0, 1000, 0, 1000)
+    if detect_format(args.filename) == "binary" and args.output is None:
+        viewer = MapViewer(args.filename)
+        plt.show()
+    else:
+        display_lands(open_map(args.filename), not args.no_points,
+                      args.output, limits)
@@ -0,0 +1,244 @@
+import math
+
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
+
+from geometry import simplify_ring
+from spatial import BoxGrid
+
+
+class MapRenderer:
+    """
+    Keeps one PolyCollection per visible land and a single scatter for free
+    points on an axes, so a redraw only touches the artists of lands that
+    changed.
+
+    Lands are kept in a bounding-box grid and only the ones overlapping the
+    viewport are drawn. Outlines are simplified with Douglas-Peucker to
+    about lod_pixels screen pixels. When more than max_land_artists lands
+    are in view they are drawn as one PolyCollection per color instead, and
+    when more than max_points free points are in view they are drawn as a
+    density image.
+    """
+
+    def __init__(self, ax, fill_alpha=0.4, cell_size=100, lod_pixels=1.0,
+                 max_land_artists=300, max_points=5000, density_bins=200):
+        self.ax = ax
+        self.fill_alpha = fill_alpha
+        self.lod_pixels = lod_pixels
+        self.max_land_artists = max_land_artists
+        self.max_points = max_points
+        self.density_bins = density_bins
+        self.land_boxes = BoxGrid(cell_size)
+        # land -> coords the land index entry was built from
+        self.indexed_coords = {}
+        # land -> (artist, coords the artist was drawn from, LOD level)
+        self.land_artists = {}
+        # land -> (coords, LOD level, simplified coords)
+        self.simplified = {}
+        # Per-color collections used when too many lands are visible
+        self.color_artists = {}
+        self.batched = False
+        self.batch_dirty = False
+        # Lands drawn in the per-color collections
+        self.batch_lands = set()
+        self.viewport = None
+        self.lod_level = 0
+        self.points_artist = ax.scatter(np.zeros(0), np.zeros(0), marker='o',
+                                        zorder=3)
+        self.density_artist = None
+
+    def set_viewport(self, min_x, max_x, min_y, max_y):
+        """
+        Set the visible window and add or drop artists to match it. The
+        per-color batches are only rebuilt when the window or LOD level
+        changed; edits mark them dirty through draw_land and forget_land.
+        """
+        viewport = (min_x, min_y, max_x, max_y)
+        width_pixels = max(self.ax.get_window_extent().width, 1)
+        tolerance = (max_x - min_x) / width_pixels * self.lod_pixels
+        # The tolerance is rounded down to a power of two so that small zoom
+        # changes do not re-simplify every outline
+        lod_level = 2.0**math.floor(math.log2(tolerance)) if tolerance > 0 else 0
+        changed = viewport != self.viewport or lod_level != self.lod_level
+        self.viewport = viewport
+        self.lod_level = lod_level
+
+        visible = self.land_boxes.query_box(*self.viewport)
+        batched = len(visible) > self.max_land_artists
+        if batched:
+            if not self.batched:
+                for land in list(self.land_artists):
+                    self._remove_artist(land)
+                changed = True
+            self.batched = True
+            if changed:
+                self.batch_dirty = True
+            self._refresh_batches()
+            return
+        self.batched = False
+        self._clear_batches()
+        visible = set(visible)
+        for land in list(self.land_artists):
+            if land not in visible:
+                self._remove_artist(land)
+        for land in visible:
+            self._draw_artist(land)
+
+    def _is_visible(self, land):
+        if self.viewport is None:
+            return True
+        min_x, min_y, max_x, max_y = self.land_boxes.boxes[land]
+        return (min_x <= self.viewport[2] and self.viewport[0] <= max_x
+                and min_y <= self.viewport[3] and self.viewport[1] <= max_y)
+
+    def _simplified_coords(self, land):
+        coords, level, simplified = self.simplified.get(land, (None, None, None))
+        if coords is not land.coords or level != self.lod_level:
+            simplified = simplify_ring(land.coords, self.lod_level)
+            self.simplified[land] = (land.coords, self.lod_level, simplified)
+        return simplified
+
+    def _draw_artist(self, land):
+        if self.batched:
+            self.batch_dirty = True
+            return
+        artist, drawn_coords, level = self.land_artists.get(
+            land, (None, None, None))
+        if (artist is not None and drawn_coords is land.coords
+                and level == self.lod_level):
+            return
+        coords = self._simplified_coords(land)
+        if artist is None:
+            artist = PolyCollection([coords], closed=True)
+            self.ax.add_collection(artist, autolim=False)
+        else:
+            artist.set_verts([coords])
+        artist.set_facecolor(to_rgba(land.color, self.fill_alpha))
+        artist.set_edgecolor(land.color)
+        self.land_artists[land] = (artist, land.coords, self.lod_level)
+
+    def _remove_artist(self, land):
+        if self.batched and land in self.batch_lands:
+            self.batch_dirty = True
+        artist, _, _ = self.land_artists.pop(land, (None, None, None))
+        if artist is not None:
+            artist.remove()
+
+    def _clear_batches(self):
+        for artist in self.color_artists.values():
+            artist.remove()
+        self.color_artists = {}
+        self.batch_lands = set()
+
+    def _refresh_batches(self):
+        if not (self.batched and self.batch_dirty):
+            return
+        self._clear_batches()
+        rings_by_color = {}
+        lands = self.land_boxes.query_box(*self.viewport)
+        for land in lands:
+            rings_by_color.setdefault(land.color, []).append(
+                self._simplified_coords(land))
+        for color, rings in rings_by_color.items():
+            artist = PolyCollection(rings, closed=True,
+                                    facecolor=to_rgba(color, self.fill_alpha),
+                                    edgecolor=color)
+            self.ax.add_collection(artist, autolim=False)
+            self.color_artists[color] = artist
+        self.batch_lands = set(lands)
+        self.batch_dirty = False
+
+    def draw_land(self, land):
+        if self.indexed_coords.get(land) is not land.coords:
+            self.land_boxes.add(land, land.bbox)
+            self.indexed_coords[land] = land.coords
+        if self._is_visible(land):
+            self._draw_artist(land)
+        else:
+            self._remove_artist(land)
+
+    def forget_land(self, land):
+        self.land_boxes.discard(land)
+        self.indexed_coords.pop(land, None)
+        self.simplified.pop(land, None)
+        self._remove_artist(land)
+
+    def apply_edit(self, edit, lands):
+        """
+        Update only the lands touched by an edit from history.EditJournal.
+        lands is any container that answers whether a land is on the map.
+        """
+        self.apply_edits([edit], lands)
+
+    def apply_edits(self, edits, lands):
+        """apply_edit for several edits, drawing each touched land once."""
+        touched = {}
+        for edit in edits:
+            for land in edit.added_lands:
+                touched[land] = None
+            for land, _ in edit.removed_lands:
+                touched[land] = None
+            for land in edit.modified_lands:
+                touched[land] = None
+        for land in touched:
+            if land in lands and len(land.coords) > 0:
+                self.draw_land(land)
+            else:
+                self.forget_land(land)
+        self._refresh_batches()
+
+    def sync(self, lands):
+        """Bring every land up to date with the given lands."""
+        current = set(lands)
+        for land in list(self.indexed_coords):
+            if land not in current:
+                self.forget_land(land)
+        for land in lands:
+            if len(land.coords) > 0:
+                self.draw_land(land)
+            else:
+                self.forget_land(land)
+        self._refresh_batches()
+
+    def draw_points(self, points):
+        """
+        Draw the free points in the viewport. points is a list of points or
+        a spatial.PointGrid, which lets the window be queried directly.
+        """
+        if self.viewport is not None and hasattr(points, "query_box"):
+            points = points.query_box(*self.viewport)
+        else:
+            points = list(points)
+        if points:
+            offsets = np.array([(point.x, point.y) for point in points])
+        else:
+            offsets = np.zeros((0, 2))
+
+        if len(points) > self.max_points and self.viewport is not None:
+            self._draw_density(offsets)
+            self.points_artist.set_offsets(np.zeros((0, 2)))
+            return
+        if self.density_artist is not None:
+            self.density_artist.set_visible(False)
+        self.points_artist.set_offsets(offsets)
+        self.points_artist.set_color([point.color for point in points])
+
+    def _draw_density(self, offsets):
+        min_x, min_y, max_x, max_y = self.viewport
+        counts, _, _ = np.histogram2d(offsets[:, 0], offsets[:, 1],
+                                      bins=self.density_bins,
+                                      range=[[min_x, max_x], [min_y, max_y]])
+        image = np.ma.masked_equal(counts.T, 0)
+        extent = (min_x, max_x, min_y, max_y)
+        if self.density_artist is None:
+            self.density_artist = self.ax.imshow(image, extent=extent,
+                                                 origin='lower', cmap='Greys',
+                                                 zorder=3,
+                                                 interpolation='nearest')
+        else:
+            self.density_artist.set_data(image)
+            self.density_artist.set_extent(extent)
+            self.density_artist.set_clim(image.min(), image.max())
+        self.density_artist.set_visible(True)
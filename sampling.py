@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+
+
+def area_rng(seed, i, j):
+    """Generator for map cell (i, j); the same (seed, i, j) gives the same points."""
+    return np.random.default_rng([seed, i + 2**31, j + 2**31])
+
+
+def uniform_points(rng, num_points, min_x, min_y, size):
+    """Integer coordinates drawn uniformly from the cell, in one call."""
+    low = [math.floor(min_x), math.floor(min_y)]
+    high = [math.floor(min_x + size), math.floor(min_y + size)]
+    return rng.integers(low, high, size=(num_points, 2))
+
+
+def jittered_points(rng, num_points, min_x, min_y, size):
+    """One point at a random spot of each of num_points sub-cells of a grid."""
+    per_side = math.ceil(math.sqrt(num_points))
+    step = size / per_side
+    cells = rng.choice(per_side * per_side, size=num_points, replace=False)
+    corners = np.column_stack([cells % per_side, cells // per_side]) * step
+    return np.array([min_x, min_y]) + corners + rng.random((num_points, 2)) * step
+
+
+def poisson_disk_points(rng, num_points, min_x, min_y, size, tries=30):
+    """
+    Bridson's Poisson-disk sampling: no two points closer than a radius
+    chosen so the cell fits about num_points of them. Returns at most
+    num_points points, picked at random from the full sample.
+    """
+    if num_points == 0:
+        return np.zeros((0, 2))
+    radius = size * math.sqrt(0.5 / num_points)
+    grid_step = radius / math.sqrt(2)
+    grid_side = math.ceil(size / grid_step)
+    # The grid has a border of two empty cells, so the 5 x 5 neighbourhood
+    # of a candidate never leaves it
+    grid = -np.ones((grid_side + 4, grid_side + 4), dtype=int)
+    window = np.arange(-2, 3)
+    window_x = np.repeat(window, 5)
+    window_y = np.tile(window, 5)
+    # Upper bound on how many points fit at that spacing
+    samples = np.empty((4 * num_points + 16, 2))
+
+    def grid_index(points):
+        cells = np.minimum((points / grid_step).astype(int), grid_side - 1)
+        return cells[..., 0] + 2, cells[..., 1] + 2
+
+    samples[0] = rng.random(2) * size
+    grid[grid_index(samples[0])] = 0
+    count = 1
+    active = [0]
+    while active:
+        index = active[rng.integers(len(active))]
+        angles = rng.random(tries) * 2 * math.pi
+        distances = radius * (1 + rng.random(tries))
+        candidates = samples[index] + np.column_stack(
+            [np.cos(angles), np.sin(angles)]) * distances[:, None]
+        candidates = candidates[((candidates >= 0)
+                                 & (candidates < size)).all(axis=1)]
+        # All candidates are checked against their neighbourhoods at once and
+        # the first one far enough from every sample is kept
+        gx, gy = grid_index(candidates)
+        neighbours = grid[gx[:, None] + window_x, gy[:, None] + window_y]
+        offsets = samples[neighbours] - candidates[:, None, :]
+        too_close = ((neighbours >= 0)
+                     & (np.hypot(offsets[..., 0], offsets[..., 1]) < radius))
+        free = np.flatnonzero(~too_close.any(axis=1))
+        if len(free) == 0 or count == len(samples):
+            active.remove(index)
+            continue
+        grid[gx[free[0]], gy[free[0]]] = count
+        samples[count] = candidates[free[0]]
+        active.append(count)
+        count += 1
+
+    samples = samples[:count]
+    if len(samples) > num_points:
+        samples = samples[rng.choice(len(samples), num_points, replace=False)]
+    return samples + np.array([min_x, min_y])
+
+
+DISTRIBUTIONS = {
+    "uniform": uniform_points,
+    "jittered": jittered_points,
+    "poisson": poisson_disk_points,
+}
+
+
+def generate_area_coords(seed, i, j, num_points, size, distribution="uniform"):
+    """
+    (num_points, 2) coordinates of cell (i, j), reproducible from the seed.
+
+    Cells are generated one at a time: each has its own generator, so the
+    points of a cell do not depend on which other cells were asked for.
+    """
+    return DISTRIBUTIONS[distribution](area_rng(seed, i, j), num_points,
+                                       i * size, j * size, size)
@@ -0,0 +1,202 @@
+import math
+
+
+class PointGrid:
+    """
+    Uniform grid (spatial hash) of items that have a position.
+
+    Items are bucketed by the cell that contains them, so inserting and
+    removing is O(1) and a radius query only looks at the cells that
+    overlap the search circle.
+    """
+
+    def __init__(self, cell_size, key=None):
+        self.cell_size = cell_size
+        self.key = key if key is not None else (lambda item: (item.x, item.y))
+        self.cells = {}
+        self.size = 0
+
+    def cell_of(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add(self, item):
+        cell = self.cells.setdefault(self.cell_of(*self.key(item)), {})
+        if item not in cell:
+            cell[item] = None
+            self.size += 1
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def discard(self, item):
+        cell_index = self.cell_of(*self.key(item))
+        cell = self.cells.get(cell_index)
+        if cell is not None and item in cell:
+            del cell[item]
+            self.size -= 1
+            if not cell:
+                del self.cells[cell_index]
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.discard(item)
+
+    def clear(self):
+        self.cells = {}
+        self.size = 0
+
+    def pop_cell(self, i, j):
+        """Remove and return every item of grid cell (i, j)."""
+        cell = self.cells.pop((i, j), {})
+        self.size -= len(cell)
+        return list(cell)
+
+    def query_radius(self, x, y, radius):
+        """Return the items that lie at most radius away from (x, y)."""
+        found = []
+        min_i, min_j = self.cell_of(x - radius, y - radius)
+        max_i, max_j = self.cell_of(x + radius, y + radius)
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = self.cells.get((i, j))
+                if cell is None:
+                    continue
+                for item in cell:
+                    item_x, item_y = self.key(item)
+                    if math.hypot(item_x - x, item_y - y) <= radius:
+                        found.append(item)
+        return found
+
+    def query_near(self, centers, radius):
+        """
+        Return the items at most radius away from any of the (x, y)
+        centers, each once, walking the cells under all circles in one pass.
+        """
+        if len(centers) == 1:
+            return self.query_radius(centers[0][0], centers[0][1], radius)
+        found = []
+        min_i, min_j = self.cell_of(min(x for x, _ in centers) - radius,
+                                    min(y for _, y in centers) - radius)
+        max_i, max_j = self.cell_of(max(x for x, _ in centers) + radius,
+                                    max(y for _, y in centers) + radius)
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = self.cells.get((i, j))
+                if cell is None:
+                    continue
+                for item in cell:
+                    item_x, item_y = self.key(item)
+                    for x, y in centers:
+                        if math.hypot(item_x - x, item_y - y) <= radius:
+                            found.append(item)
+                            break
+        return found
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """Return the items inside the axis-aligned box."""
+        found = []
+        for cell in self._cells_in_box(min_x, min_y, max_x, max_y):
+            for item in cell:
+                item_x, item_y = self.key(item)
+                if min_x <= item_x <= max_x and min_y <= item_y <= max_y:
+                    found.append(item)
+        return found
+
+    def _cells_in_box(self, min_x, min_y, max_x, max_y):
+        min_i, min_j = self.cell_of(min_x, min_y)
+        max_i, max_j = self.cell_of(max_x, max_y)
+        # For a large box it is cheaper to walk only the occupied cells
+        if (max_i - min_i + 1) * (max_j - min_j + 1) > len(self.cells):
+            for (i, j), cell in self.cells.items():
+                if min_i <= i <= max_i and min_j <= j <= max_j:
+                    yield cell
+            return
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = self.cells.get((i, j))
+                if cell is not None:
+                    yield cell
+
+    def __contains__(self, item):
+        cell = self.cells.get(self.cell_of(*self.key(item)))
+        return cell is not None and item in cell
+
+    def __iter__(self):
+        for cell in self.cells.values():
+            yield from cell
+
+    def __len__(self):
+        return self.size
+
+
+class BoxGrid:
+    """
+    Uniform grid of items with bounding boxes.
+
+    An item is registered in every cell its box overlaps, so a window query
+    only looks at the cells under the window.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+
+    def _cell_range(self, min_x, min_y, max_x, max_y):
+        return (math.floor(min_x / self.cell_size),
+                math.floor(min_y / self.cell_size),
+                math.floor(max_x / self.cell_size),
+                math.floor(max_y / self.cell_size))
+
+    def add(self, item, box):
+        self.discard(item)
+        self.boxes[item] = box
+        min_i, min_j, max_i, max_j = self._cell_range(*box)
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                self.cells.setdefault((i, j), {})[item] = None
+
+    def discard(self, item):
+        box = self.boxes.pop(item, None)
+        if box is None:
+            return
+        min_i, min_j, max_i, max_j = self._cell_range(*box)
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = self.cells[(i, j)]
+                del cell[item]
+                if not cell:
+                    del self.cells[(i, j)]
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """Return the items whose boxes overlap the given box."""
+        min_i, min_j, max_i, max_j = self._cell_range(min_x, min_y, max_x,
+                                                      max_y)
+        if (max_i - min_i + 1) * (max_j - min_j + 1) > len(self.cells):
+            candidates = (cell for (i, j), cell in self.cells.items()
+                          if min_i <= i <= max_i and min_j <= j <= max_j)
+        else:
+            candidates = (self.cells.get((i, j), {})
+                          for i in range(min_i, max_i + 1)
+                          for j in range(min_j, max_j + 1))
+        found = {}
+        for cell in candidates:
+            for item in cell:
+                if item in found:
+                    continue
+                box = self.boxes[item]
+                if (box[0] <= max_x and min_x <= box[2] and box[1] <= max_y
+                        and min_y <= box[3]):
+                    found[item] = None
+        return list(found)
+
+    def __contains__(self, item):
+        return item in self.boxes
+
+    def __iter__(self):
+        return iter(self.boxes)
+
+    def __len__(self):
+        return len(self.boxes)
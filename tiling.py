@@ -0,0 +1,261 @@
+import math
+import multiprocessing
+
+import numpy as np
+
+from engine import Land, MapArea, MapEngine, Point
+from geometry import close_pairs, convex_hull
+from history import EditJournal
+from spatial import BoxGrid
+
+
+def split_clicks(clicks, tile_size):
+    """Groups clicks by the tile they fall into, keeping their order."""
+    tiles = {}
+    for click in clicks:
+        tile = (math.floor(click["x"] / tile_size),
+                math.floor(click["y"] / tile_size))
+        tiles.setdefault(tile, []).append(click)
+    return tiles
+
+
+def generate_tile(job):
+    """
+    Runs the clicks of one tile on its own MapEngine and returns the lands
+    as (coords, color) pairs.
+
+    Points come from the per-cell generators of the map seed, and the
+    MapArea cells around the tile are marked as covered without points, so
+    a tile only ever uses points from its own cells and two tiles never
+    build lands from the same points.
+    """
+    tile, clicks, seed, tile_cells, engine_options = job
+    engine = MapEngine(seed=seed, **engine_options)
+    engine.history = EditJournal(max_bytes=0)
+    area_size = engine.plot_size / engine.rows
+    margin = math.ceil(engine.search_range / area_size)
+    first_i, first_j = tile[0] * tile_cells, tile[1] * tile_cells
+    for i in range(first_i - margin, first_i + tile_cells + margin):
+        for j in range(first_j - margin, first_j + tile_cells + margin):
+            if not (first_i <= i < first_i + tile_cells
+                    and first_j <= j < first_j + tile_cells):
+                area = MapArea(i, j, area_size)
+                area.points_generated = True
+                engine.map_coverage[(i, j)] = area
+
+    for click in clicks:
+        engine.mode = click.get("mode", "write")
+        engine.color = click.get("color", engine.color)
+        engine.click(click["x"], click["y"])
+    return tile, [(land.coords, land.color) for land in engine.lands]
+
+
+def _expand(box, distance):
+    min_x, min_y, max_x, max_y = box
+    return (min_x - distance, min_y - distance, max_x + distance,
+            max_y + distance)
+
+
+def _boxes_meet(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def join_border_lands(lands, origin, border_lands, all_lands, merge_distance,
+                      seams=None):
+    """
+    Joins each of lands with the border lands of other tiles that come
+    within merge_distance of it and returns the set of lands it changed.
+
+    border_lands holds the border lands with boxes grown by merge_distance
+    and all_lands every land with its box; joined and emptied lands are
+    discarded from both. Pairs of lands of the same seam in seams are
+    skipped.
+    """
+    changed = set()
+    for land in lands:
+        if land not in border_lands:
+            continue
+        for other in border_lands.query_box(*border_lands.boxes[land]):
+            if (other not in border_lands or origin[other] == origin[land]
+                    or land not in border_lands):
+                continue
+            if seams and seams.get(other, -1) == seams.get(land):
+                continue
+            close, other_close = close_pairs(land.coords, other.coords,
+                                             merge_distance)
+            if not len(close):
+                continue
+            changed.update((land, other))
+            if other.color == land.color:
+                # The lands may not touch, so they are first joined by the
+                # hull of their vertices that are close to each other
+                bridge = np.vstack([land.coords[np.unique(close)],
+                                    other.coords[np.unique(other_close)]])
+                hull = convex_hull(bridge)
+                if len(hull) >= 3:
+                    land.grow_land([Point(x, y, land.color)
+                                    for x, y in bridge[hull].tolist()], [])
+                land.grow_land(other.points.copy(), [])
+                border_lands.discard(other)
+                all_lands.discard(other)
+                # The bridge may reach over lands of other colors, which
+                # are cut out of the grown land again. Both lands already
+                # kept clear of their own tiles, so only the lands under
+                # the bridge and the joined land are looked at
+                reach = np.vstack([bridge, other.coords])
+                for foreign in all_lands.query_box(*reach.min(axis=0),
+                                                   *reach.max(axis=0)):
+                    if foreign.color != land.color:
+                        land.mini_grow(foreign, [])
+                        if len(land.coords) < 3:
+                            break
+            elif _boxes_meet(land.bbox, other.bbox):
+                land.mini_grow(other, [])
+            if len(land.coords) < 3:
+                border_lands.discard(land)
+                all_lands.discard(land)
+                break
+            all_lands.add(land, land.bbox)
+            border_lands.add(land, _expand(land.bbox, merge_distance))
+    return changed
+
+
+def merge_seam(job):
+    """
+    Joins the lands of one seam on copies and returns (index, coords) for
+    every member that changed, with coords None for a member that was
+    joined into another or cut away.
+
+    The (coords, color) of the lands around the seam are only read, so
+    seams can be merged in any order or in parallel.
+    """
+    members, around, merge_distance, cell_size = job
+    lands = [Land.from_coords(coords, color) for coords, color, _ in members]
+    origin = {land: tile for land, (_, _, tile) in zip(lands, members)}
+    all_lands = BoxGrid(cell_size)
+    for coords, color in around:
+        land = Land.from_coords(coords, color)
+        all_lands.add(land, land.bbox)
+    border_lands = BoxGrid(cell_size)
+    for land in lands:
+        all_lands.add(land, land.bbox)
+        border_lands.add(land, _expand(land.bbox, merge_distance))
+    changed = join_border_lands(lands, origin, border_lands, all_lands,
+                                merge_distance)
+    return [(index, land.coords if land in border_lands else None)
+            for index, land in enumerate(lands) if land in changed]
+
+
+def merge_tiles(tile_lands, engine, tile_size, merge_distance=None,
+                pool=None):
+    """
+    Adds the lands of every tile to engine and joins lands of neighbouring
+    tiles that come within merge_distance of each other across a border:
+    same-colored lands are joined with grow_land through the hull of their
+    nearby vertices, and the joined land is cut back with mini_grow from
+    every land of another color under the join; a land of another color
+    is cut back to the other land's outline with mini_grow.
+
+    Border lands of different tiles linked by closeness form seams, which
+    are merged independently by merge_seam, in pool if one is given. The
+    lands the seams changed are then joined once more, serially, with the
+    lands of other seams and the ones they only reached by growing.
+    """
+    if merge_distance is None:
+        merge_distance = engine.search_range
+    cell_size = engine.plot_size / engine.rows
+    origin = {}
+    for tile in sorted(tile_lands):
+        for coords, color in tile_lands[tile]:
+            land = Land.from_coords(coords, color)
+            origin[land] = tile
+            engine.add_land(land)
+
+    border_lands = BoxGrid(cell_size)
+    for land, tile in origin.items():
+        min_x, min_y, max_x, max_y = _expand(land.bbox, merge_distance)
+        if (min_x < tile[0] * tile_size or max_x >= (tile[0] + 1) * tile_size
+                or min_y < tile[1] * tile_size
+                or max_y >= (tile[1] + 1) * tile_size):
+            border_lands.add(land, (min_x, min_y, max_x, max_y))
+
+    order = {land: index for index, land in enumerate(border_lands)}
+    parent = list(range(len(order)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for land, index in order.items():
+        for other in border_lands.query_box(*border_lands.boxes[land]):
+            if order[other] > index and origin[other] != origin[land] and len(
+                    close_pairs(land.coords, other.coords,
+                                merge_distance)[0]):
+                parent[find(order[other])] = find(index)
+    groups = {}
+    for land, index in order.items():
+        groups.setdefault(find(index), []).append(land)
+    groups = [group for group in groups.values() if len(group) > 1]
+
+    jobs = []
+    for group in groups:
+        members = set(group)
+        boxes = np.array([land.bbox for land in group])
+        around = [(land.coords, land.color)
+                  for land in engine.land_index.boxes.query_box(
+                      *boxes[:, :2].min(axis=0), *boxes[:, 2:].max(axis=0))
+                  if land not in members]
+        jobs.append(([(land.coords, land.color, origin[land])
+                      for land in group], around, merge_distance, cell_size))
+    results = pool.map(merge_seam, jobs) if pool else map(merge_seam, jobs)
+
+    seams = {}
+    for number, (group, result) in enumerate(zip(groups, results)):
+        for index, coords in result:
+            land = group[index]
+            if coords is None:
+                border_lands.discard(land)
+                engine.remove_lands([land])
+                continue
+            land.coords = coords
+            engine.reindex_land(land)
+            border_lands.add(land, _expand(land.bbox, merge_distance))
+            seams[land] = number
+
+    # Each seam only saw the lands of the other seams from before the merge
+    all_lands = BoxGrid(cell_size)
+    for land in engine.lands:
+        all_lands.add(land, land.bbox)
+    changed = join_border_lands(list(seams), origin, border_lands, all_lands,
+                                merge_distance, seams)
+    for land in changed:
+        if land in all_lands:
+            engine.reindex_land(land)
+    engine.remove_lands([land for land in changed if land not in all_lands])
+    return engine
+
+
+def generate_tiled(clicks, seed=0, tile_cells=5, workers=None,
+                   engine_options=None):
+    """
+    Generates a map by running the clicks of each tile of tile_cells x
+    tile_cells MapArea cells in a process pool and merging the results.
+    The result does not depend on the number of workers.
+    """
+    engine_options = engine_options or {}
+    engine = MapEngine(seed=seed, **engine_options)
+    engine.history = EditJournal(max_bytes=0)
+    tile_size = tile_cells * engine.plot_size / engine.rows
+    jobs = [(tile, tile_clicks, seed, tile_cells, engine_options)
+            for tile, tile_clicks in sorted(
+                split_clicks(clicks, tile_size).items())]
+
+    if workers == 1:
+        tile_lands = dict(map(generate_tile, jobs))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            tile_lands = dict(pool.imap_unordered(generate_tile, jobs))
+            return merge_tiles(tile_lands, engine, tile_size, pool=pool)
+    return merge_tiles(tile_lands, engine, tile_size)
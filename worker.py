@@ -0,0 +1,113 @@
+import queue
+import threading
+
+
+class EditWorker:
+    """
+    Runs map edits on a background thread so the window stays responsive.
+
+    Jobs are callables taking the engine and returning an edit (or None).
+    They run one at a time, in submission order, holding lock; anything
+    reading the engine from another thread must hold lock too. Finished
+    jobs leave (version, edit) on the results queue, version counting the
+    edits applied to the engine so far.
+
+    A reader that takes the lock with try_acquire() and finds it busy is
+    let in before the next job: the worker waits up to yield_timeout
+    seconds for it, so a burst of queued jobs does not keep the reader out
+    until the queue is empty.
+
+    cancel() drops every job still waiting in the queue. A job that already
+    started finishes, since its edit has changed the engine and its result
+    is needed to keep the view in step. A job that raises has its open
+    history edit rolled back and leaves the exception as its result.
+    """
+
+    def __init__(self, engine, yield_timeout=0.1):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.yield_timeout = yield_timeout
+        # Set while a reader waits for the lock; the worker does not start
+        # the next job until it is cleared by release()
+        self.reader_waiting = False
+        self.turn = threading.Condition()
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.generation = 0
+        self.version = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        self.jobs.put((self.generation, job))
+
+    def cancel(self):
+        """Forget the queued jobs; returns how many were dropped."""
+        self.generation += 1
+        dropped = 0
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                return dropped
+            self.jobs.task_done()
+            dropped += 1
+
+    def pending(self):
+        return self.jobs.unfinished_tasks
+
+    def join(self):
+        """Wait until every submitted job has run."""
+        self.jobs.join()
+
+    def try_acquire(self):
+        """
+        Take lock without waiting; True on success, then release() must
+        follow. On failure the worker lets the caller in after its current
+        job.
+        """
+        if self.lock.acquire(blocking=False):
+            return True
+        with self.turn:
+            self.reader_waiting = True
+        return False
+
+    def release(self):
+        """Release a lock taken with try_acquire()."""
+        with self.turn:
+            self.reader_waiting = False
+            self.turn.notify_all()
+        self.lock.release()
+
+    def finished(self):
+        """(version, edit) of the jobs finished since the last call."""
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def _run(self):
+        while True:
+            generation, job = self.jobs.get()
+            try:
+                if generation == self.generation:
+                    with self.turn:
+                        self.turn.wait_for(lambda: not self.reader_waiting,
+                                           self.yield_timeout)
+                        self.reader_waiting = False
+                    with self.lock:
+                        try:
+                            edit = job(self.engine)
+                        except Exception:
+                            # The map must not stay half changed
+                            self.engine.history.rollback(self.engine)
+                            raise
+                        self.version += 1
+                    self.results.put((self.version, edit))
+            except Exception as error:
+                # A failed job must not stop the worker; the editor reports it
+                self.results.put((self.version, error))
+            finally:
+                self.jobs.task_done()